@@ -1,23 +1,42 @@
 from collections import defaultdict
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy, deepcopy
 import csv
-from datetime import datetime
+from functools import lru_cache
+import gzip
+import heapq
+import io
+import lzma
 from pprint import pformat
 import string
+import sys
 from threading import Timer
+import zipfile
 
-from interruptingcow import timeout
-
-from algorithm_u import algorithm_u
 import category
 from currency import micro_usd_nearly_equal
 from currency import micro_usd_to_usd_string
 from currency import parse_usd_as_micro_usd
+from currency import parse_usd_list_as_micro_usd
 from currency import CENT_MICRO_USD, MICRO_USD_EPS
+from dates import parse_amazon_date
 from mint import truncate_title
+from partition import partition_by_subtotals
+from partition import SearchBudget, SearchBudgetExhausted
+from partition import DEFAULT_MAX_STATES_PER_PARTITION
 
 PRINTABLE = set(string.printable)
 
+# Bump this whenever parsing changes what ends up on a record, so that cached
+# reports are re-parsed.
+PARSER_VERSION = 1
+
+# Records are converted a column at a time in batches of this many rows.
+PYTHONIFY_BATCH_ROWS = 1024
+
+# Reports smaller than this aren't worth the overhead of a process pool.
+PARALLEL_PARSE_MIN_CHARS = 4 * 1024 * 1024
+
 
 def get_title(amzn_obj, target_length):
     # Also works for a Refund record.
@@ -57,59 +76,310 @@ RENAME_FIELD_NAMES = {
 }
 
 
-def is_empty_csv(csv_file_obj, key='Quantity'):
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+def open_report(path):
+    """Opens an Amazon report (a path or '-' for stdin) as a text stream."""
+    return open_report_stream(sys.stdin.buffer if path == '-'
+                              else open(path, 'rb'))
+
+
+def open_report_stream(raw):
+    """Wraps a binary stream of an Amazon report as a text stream.
+
+    gzip, xz and zip compressed reports are detected by their magic bytes
+    and decompressed on the fly as they are read; nothing is written to
+    disk. For a zip, the first .csv in the archive is used.
+    """
+    if not hasattr(raw, 'peek'):
+        raw = io.BufferedReader(raw)
+    magic = raw.peek(len(XZ_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=raw)
+    elif magic.startswith(XZ_MAGIC):
+        stream = lzma.LZMAFile(raw)
+    elif magic.startswith(ZIP_MAGIC):
+        if not raw.seekable():
+            # Zips keep their index at the end, so pipes must be buffered.
+            raw = io.BytesIO(raw.read())
+        archive = zipfile.ZipFile(raw)
+        names = archive.namelist()
+        csv_names = [n for n in names if n.lower().endswith('.csv')]
+        stream = archive.open((csv_names or names)[0])
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def get_field_name(column_name):
+    """Returns the pythonic attribute name for an Amazon report column."""
+    if column_name in RENAME_FIELD_NAMES:
+        return RENAME_FIELD_NAMES[column_name]
+    return column_name.lower().replace(' ', '_').replace('/', '_')
+
+
+def get_field_converter(column_name):
+    if column_name in CURRENCY_FIELD_NAMES:
+        # Convert to microdollar ints
+        return parse_usd_as_micro_usd
+    if column_name in DATE_FIELD_NAMES:
+        # Convert to datetime.date
+        return parse_amazon_date
+    if column_name == 'Quantity':
+        return int
+    return None
+
+
+def get_column_converter(column_name):
+    """Like get_field_converter, but converts a whole column of values."""
+    if column_name in CURRENCY_FIELD_NAMES:
+        return parse_usd_list_as_micro_usd
+    converter = get_field_converter(column_name)
+    if converter:
+        return lambda values: list(map(converter, values))
+    return None
+
+
+class CsvSchema:
+    """The column layout of an Amazon report, compiled once per header row.
+
+    Holds the final attribute name for every column index along with the
+    converters for the columns that need one, so turning a record into
+    fields is a zip plus a handful of conversions. If fields is given, only
+    the columns whose attribute names are in it are kept (a projection);
+    the rest are never converted or stored.
+    """
+
+    def __init__(self, header, fields=None):
+        self.header = tuple(header)
+        columns = [
+            (idx, get_field_name(c), get_field_converter(c),
+             get_column_converter(c))
+            for idx, c in enumerate(self.header)]
+        if fields is not None:
+            columns = [c for c in columns if c[1] in fields]
+        self.indices = tuple(c[0] for c in columns)
+        self.names = tuple(c[1] for c in columns)
+        self.converters = tuple(
+            (name, converter) for _, name, converter, _ in columns
+            if converter)
+        self.column_converters = tuple(
+            (pos, column_converter)
+            for pos, (_, _, _, column_converter) in enumerate(columns)
+            if column_converter)
+        self.is_projection = len(self.indices) < len(self.header)
+
+    def pad_and_project(self, values):
+        if len(values) < len(self.header):
+            # Short rows are padded the same way DictReader does.
+            values = list(values) + [None] * (len(self.header) - len(values))
+        if self.is_projection:
+            values = [values[i] for i in self.indices]
+        return values
+
+    def pythonify(self, values):
+        """Returns a dict of attribute name to converted value for a row."""
+        fields = dict(zip(self.names, self.pad_and_project(values)))
+        for name, converter in self.converters:
+            fields[name] = converter(fields[name])
+        return fields
+
+    def pythonify_rows(self, rows):
+        """Returns a list of pythonify(row) for rows.
+
+        Each column needing conversion is converted in one call, so the
+        currency columns go through parse_usd_list_as_micro_usd.
+        """
+        if not rows:
+            return []
+        columns = list(zip(*map(self.pad_and_project, rows)))
+        for pos, converter in self.column_converters:
+            columns[pos] = converter(columns[pos])
+        return [dict(zip(self.names, values)) for values in zip(*columns)]
+
+
+@lru_cache(maxsize=32)
+def get_schema(header):
+    return CsvSchema(header)
+
+
+def is_empty_csv_row(row, header):
     # Amazon likes to put "No data found for this time period" in the first
-    # row.
-    filename = csv_file_obj.name
-    return (sum([1 for r in csv.DictReader(open(filename))]) <= 1 and
-            next(csv.DictReader(open(filename)))[key] is None)
-
-
-def parse_from_csv_common(cls, csv_file, progress):
-    if is_empty_csv(csv_file):
-        return []
-
-    reader = csv.DictReader(csv_file)
-    iter = progress.iter(reader) if progress else reader
-    result = [cls(raw_dict) for raw_dict in iter]
+    # row. Only the first column is populated.
+    return len(header) > 1 and len(row) <= 1
+
+
+def iter_fields_from_csv(csv_file, fields=None, is_first_chunk=True):
+    """Yields a dict of pythonified fields per record of an Amazon report.
+
+    csv_file is read exactly once and can be any iterable of lines: a file,
+    a pipe (stdin) or an in-memory buffer such as io.StringIO. Blank lines
+    are skipped, like DictReader does. is_first_chunk is False for the
+    later chunks of a report parsed in parallel, whose first record isn't
+    the first of the report.
+    """
+    reader = csv.reader(csv_file)
+    header = next(reader, None)
+    if not header:
+        return
+    schema = CsvSchema(header, fields)
+    is_first = is_first_chunk
+    batch = []
+    for row in reader:
+        if not row:
+            continue
+        if is_first:
+            is_first = False
+            if is_empty_csv_row(row, header):
+                continue
+        batch.append(row)
+        if len(batch) >= PYTHONIFY_BATCH_ROWS:
+            yield from schema.pythonify_rows(batch)
+            batch = []
+    yield from schema.pythonify_rows(batch)
+
+
+def iter_from_csv_common(cls, csv_file, all_fields=False):
+    """Yields a cls object per record of csv_file.
+
+    Unless all_fields is set, only the columns in cls.FIELDS are kept.
+    """
+    for fields in iter_fields_from_csv(
+            csv_file, None if all_fields else cls.FIELDS):
+        yield cls.from_fields(fields)
+
+
+def find_record_start(content, pos):
+    """Returns the index of the first CSV record starting after pos.
+
+    A newline only ends a record when it is outside of quotes, which is
+    whenever an even number of quote characters precede it (escaped quotes
+    come in pairs). This keeps titles with embedded newlines intact.
+    """
+    quotes = content.count('"', 0, pos)
+    while True:
+        newline = content.find('\n', pos)
+        if newline == -1:
+            return len(content)
+        quotes += content.count('"', pos, newline)
+        pos = newline + 1
+        if quotes % 2 == 0:
+            return pos
+
+
+def split_csv_records(content, num_chunks):
+    """Splits the records of CSV text into up to num_chunks byte ranges.
+
+    Returns the header text and a list of (start, end) ranges into content.
+    Every range starts and ends on a record boundary.
+    """
+    header_end = find_record_start(content, 0)
+    bounds = [header_end]
+    data_len = len(content) - header_end
+    for i in range(1, num_chunks):
+        target = header_end + data_len * i // num_chunks
+        if target <= bounds[-1]:
+            continue
+        start = find_record_start(content, target - 1)
+        if start >= len(content):
+            break
+        if start > bounds[-1]:
+            bounds.append(start)
+    bounds.append(len(content))
+    return content[:header_end], list(zip(bounds, bounds[1:]))
+
+
+def parse_csv_chunk(header, chunk, fields, is_first_chunk):
+    return list(iter_fields_from_csv(
+        io.StringIO(header + chunk, newline=''), fields, is_first_chunk))
+
+
+def parse_fields_from_csv_parallel(content, fields, workers):
+    """Parses CSV text in a pool of worker processes.
+
+    The records are split into record-aligned ranges which are parsed in
+    parallel; the results are merged back in file order so they are
+    identical to parsing serially.
+    """
+    header, ranges = split_csv_records(content, workers * 4)
+    chunks = [content[start:end] for start, end in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            parse_csv_chunk,
+            [header] * len(chunks),
+            chunks,
+            [fields] * len(chunks),
+            [idx == 0 for idx in range(len(chunks))])
+        return [r for chunk_result in results for r in chunk_result]
+
+
+def parse_fields_from_csv_content(content, fields, workers=1):
+    if workers > 1 and len(content) >= PARALLEL_PARSE_MIN_CHARS:
+        return parse_fields_from_csv_parallel(content, fields, workers)
+    return list(iter_fields_from_csv(io.StringIO(content, newline=''), fields))
+
+
+def parse_from_csv_common(
+        cls, csv_file, progress=None, all_fields=False, cache=None,
+        workers=1):
+    fields = None if all_fields else cls.FIELDS
+    if cache:
+        content = csv_file.read()
+        key = cache.get_key(content, PARSER_VERSION, cls.__name__, all_fields)
+        records = cache.load(key)
+        if records is None:
+            records = parse_fields_from_csv_content(content, fields, workers)
+            cache.store(key, records)
+        records = map(cls.from_fields, records)
+    elif workers > 1:
+        records = map(cls.from_fields, parse_fields_from_csv_content(
+            csv_file.read(), fields, workers))
+    else:
+        records = iter_from_csv_common(cls, csv_file, all_fields)
+    iter = progress.iter(records) if progress else records
+    result = list(iter)
     if progress:
         print()
     return result
 
 
-def pythonify_amazon_dict(raw_dict):
-    keys = set(raw_dict.keys())
-
-    # Convert to microdollar ints
-    for ck in keys & CURRENCY_FIELD_NAMES:
-        raw_dict[ck] = parse_usd_as_micro_usd(raw_dict[ck])
-
-    # Convert to datetime.date
-    for dk in keys & DATE_FIELD_NAMES:
-        raw_dict[dk] = parse_amazon_date(raw_dict[dk])
-
-    # Rename long or unpythonic names:
-    for old_key in keys & RENAME_FIELD_NAMES.keys():
-        new_key = RENAME_FIELD_NAMES[old_key]
-        raw_dict[new_key] = raw_dict[old_key]
-        del raw_dict[old_key]
+def dedupe_reports(records_per_report, key_fields):
+    """Merges the records of several reports, dropping overlapping rows.
+
+    Reports from multiple accounts or overlapping date ranges repeat rows.
+    A row is identified by its key_fields; a later report only contributes
+    the rows of a key beyond the count already seen in an earlier report,
+    so repeated identical rows within a single report are all kept.
+    """
+    seen = defaultdict(int)
+    result = []
+    for records in records_per_report:
+        in_report = defaultdict(int)
+        for r in records:
+            key = tuple(getattr(r, f) for f in key_fields)
+            in_report[key] += 1
+            if in_report[key] > seen[key]:
+                result.append(r)
+        for key, count in in_report.items():
+            seen[key] = max(seen[key], count)
+    return result
 
-    if 'Quantity' in keys:
-        raw_dict['Quantity'] = int(raw_dict['Quantity'])
 
-    return dict([
-        (k.lower().replace(' ', '_').replace('/', '_'), v)
-        for k, v in raw_dict.items()
-    ])
+def parse_from_csv_files_common(
+        cls, csv_files, progress=None, all_fields=False, cache=None,
+        workers=1):
+    return dedupe_reports(
+        [parse_from_csv_common(cls, f, progress, all_fields, cache, workers)
+         for f in csv_files],
+        cls.DEDUPE_FIELDS)
 
 
-def parse_amazon_date(date_str):
-    if not date_str:
-        return None
-    try:
-        return datetime.strptime(date_str, '%m/%d/%Y').date()
-    except ValueError:
-        return datetime.strptime(date_str, '%m/%d/%y').date()
+def pythonify_amazon_dict(raw_dict):
+    return get_schema(tuple(raw_dict.keys())).pythonify(
+        tuple(raw_dict.values()))
 
 
 def get_invoice_url(order_id):
@@ -118,7 +388,129 @@ def get_invoice_url(order_id):
         'orderID={oid}'.format(oid=order_id))
 
 
-def associate_items_with_orders(all_orders, all_items, itemProgress=None):
+def get_record_fingerprint(record):
+    """The known fields of record (an Order, Item or Refund), as a tuple of
+    (name, value), to tell whether it changed between runs."""
+    return tuple(
+        (name, getattr(record, name, None)) for name in sorted(record.FIELDS))
+
+
+def split_oid_items_by_tracking(orders, items):
+    """Associates what it can of one order id's items with its orders
+    (shipments) by tracking number.
+
+    Orders are given as (subtotal, tracking) and items as (item_subtotal,
+    tracking) tuples.
+
+    Returns (by_tracking, order_idxs, item_idxs): the (order index, item
+    indices) assignments made, and the indices of the orders and items left
+    to be split up by subtotal. Returns None if the subtotals don't add up.
+    """
+    if not micro_usd_nearly_equal(
+            sum(o[0] for o in orders),
+            sum(i[0] for i in items)):
+        # This is likely due to reports being pulled before all outstanding
+        # orders have shipped. Just skip this order for now.
+        return None
+
+    if len(orders) == 1:
+        return [(0, list(range(len(items))))], [], []
+
+    items_by_tracking = defaultdict(list)
+    for idx, (_, tracking) in enumerate(items):
+        items_by_tracking[tracking].append(idx)
+
+    # It is never the case that multiple orders with the same order id will
+    # have the same tracking number. Try using tracking number to split up
+    # the items between the orders.
+    by_tracking = []
+    tracked = set()
+    for order_idx, (subtotal, tracking) in enumerate(orders):
+        item_idxs = items_by_tracking[tracking]
+        if micro_usd_nearly_equal(
+                sum(items[i][0] for i in item_idxs),
+                subtotal):
+            # A perfect fit.
+            by_tracking.append((order_idx, item_idxs))
+            tracked.update(item_idxs)
+    # Remove orders that have items, and the selected items.
+    order_idxs = [
+        idx for idx in range(len(orders))
+        if not any(o == idx and i for o, i in by_tracking)]
+    item_idxs = [idx for idx in range(len(items)) if idx not in tracked]
+    return by_tracking, order_idxs, item_idxs
+
+
+def get_partition_key(orders, items, order_idxs, item_idxs):
+    """The sorted item subtotals and sorted order subtotals to partition.
+
+    Orders with the same shape partition the same way, so this is also the
+    key partitions are memoized by.
+    """
+    return (tuple(sorted(items[i][0] for i in item_idxs)),
+            tuple(sorted(orders[o][0] for o in order_idxs)))
+
+
+def partition_by_key(key, max_states):
+    """Partitions the item subtotals of a partition key amongst its order
+    subtotals.
+
+    Returns (grouping, states, over_budget): the index of the order subtotal
+    for each item subtotal (or None), how many states the search explored,
+    and whether it ran out of its max_states. Cheap to run in a worker
+    process.
+    """
+    budget = SearchBudget(max_states)
+    try:
+        grouping = partition_by_subtotals(*key, budget=budget)
+    except SearchBudgetExhausted:
+        return None, budget.states, True
+    return grouping, budget.states, False
+
+
+def assign_by_subtotal(orders, items, order_idxs, item_idxs, grouping):
+    """Maps a grouping of a partition key back onto orders and items.
+
+    Returns a list of (order index, item indices) assignments.
+    """
+    sorted_item_idxs = sorted(item_idxs, key=lambda i: items[i][0])
+    sorted_order_idxs = sorted(order_idxs, key=lambda o: orders[o][0])
+    item_idxs_by_order = defaultdict(list)
+    for item_idx, g in zip(sorted_item_idxs, grouping):
+        item_idxs_by_order[sorted_order_idxs[g]].append(item_idx)
+    return [(o, sorted(item_idxs_by_order[o])) for o in order_idxs]
+
+
+# Stands in for a partition that hasn't been memoized, as None (no possible
+# partition) is memoized too.
+NOT_MEMOIZED = object()
+
+
+def associate_items_with_orders(
+        all_orders, all_items, itemProgress=None,
+        max_states_per_order=DEFAULT_MAX_STATES_PER_PARTITION,
+        max_states=None, workers=1, partition_memo=None):
+    """Sets the items on each order, splitting the items of an order id
+    amongst its shipments.
+
+    Splitting items by subtotal is a search limited to max_states_per_order
+    explored states per order id, and max_states for the whole call (None
+    is unlimited for either). Order ids whose search runs out of budget are
+    left unmatched.
+
+    Searches are memoized in partition_memo (a dict or cache.LruMemo) by
+    the shape of the order id, so repeat orders are only searched once.
+    Memoized partitions cost no states.
+
+    With workers > 1, the searches run in a pool of worker processes,
+    hardest first. The whole call's budget is still charged in order id
+    order, so the results are identical to associating serially.
+
+    Returns a list of (order id, number of items, number of shipments) for
+    every order id that ran out of budget.
+    """
+    if partition_memo is None:
+        partition_memo = {}
     items_by_oid = defaultdict(list)
     for i in all_items:
         items_by_oid[i.order_id].append(i)
@@ -126,70 +518,121 @@ def associate_items_with_orders(all_orders, all_items, itemProgress=None):
     for o in all_orders:
         orders_by_oid[o.order_id].append(o)
 
+    # Order ids as (orders, items, split by tracking, partition key).
+    to_associate = []
     for oid, orders in orders_by_oid.items():
-        oid_items = items_by_oid[oid]
-
-        if not micro_usd_nearly_equal(
-                Order.sum_subtotals(orders),
-                Item.sum_subtotals(oid_items)):
-            # This is likely due to reports being pulled before all outstanding
-            # orders have shipped. Just skip this order for now.
-            continue
-
-        if len(orders) == 1:
-            orders[0].set_items(oid_items, assert_unmatched=True)
-            if itemProgress: itemProgress.next(len(oid_items))
-            continue
-
-        # First try to divy up the items by tracking.
-        items_by_tracking = defaultdict(list)
-        for i in oid_items:
-            items_by_tracking[i.tracking].append(i)
-
-        # It is never the case that multiple orders with the same order id will
-        # have the same tracking number. Try using tracking number to split up
-        # the items between the orders.
-        for order in orders:
-            items = items_by_tracking[order.tracking]
-            if micro_usd_nearly_equal(
-                    Item.sum_subtotals(items),
-                    order.subtotal):
-                # A perfect fit.
-                order.set_items(items, assert_unmatched=True)
+        orders_tuples = [(o.subtotal, o.tracking) for o in orders]
+        items_tuples = [
+            (i.item_subtotal, i.tracking) for i in items_by_oid[oid]]
+        split = split_oid_items_by_tracking(orders_tuples, items_tuples)
+        key = None
+        if split and (split[1] or split[2]):
+            key = get_partition_key(orders_tuples, items_tuples, *split[1:])
+        to_associate.append((oid, orders_tuples, items_tuples, split, key))
+
+    executor = None
+    futures = {}
+    if workers > 1:
+        keys = {k for _, _, _, _, k in to_associate
+                if k and k not in partition_memo}
+        if keys:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            # Start on the hardest partitions first, so that one of them
+            # doesn't hold everything up at the end.
+            for key in sorted(
+                    keys, key=lambda k: (len(k[0]), len(k[1])),
+                    reverse=True):
+                futures[key] = executor.submit(
+                    partition_by_key, key, max_states_per_order)
+
+    over_budget = []
+    states_left = max_states
+    try:
+        for oid, orders_tuples, items_tuples, split, key in to_associate:
+            if not split:
+                continue
+            by_tracking, order_idxs, item_idxs = split
+            by_subtotal = []
+            if key:
+                grouping = partition_memo.get(key, NOT_MEMOIZED)
+                if grouping is NOT_MEMOIZED:
+                    if key in futures:
+                        result = futures[key].result()
+                    else:
+                        result = partition_by_key(key, min(
+                            (s for s in (max_states_per_order, states_left)
+                             if s is not None),
+                            default=None))
+                    grouping, states, out_of_states = result
+                    if states_left is not None:
+                        if states > states_left:
+                            # Only possible when run in a worker, which
+                            # doesn't know how much of the whole call's
+                            # budget is left.
+                            out_of_states = True
+                        states_left = max(0, states_left - states)
+                    if out_of_states:
+                        grouping = None
+                        over_budget.append(
+                            (oid, len(items_tuples), len(orders_tuples)))
+                    else:
+                        partition_memo[key] = grouping
+                if grouping is not None:
+                    by_subtotal = assign_by_subtotal(
+                        orders_tuples, items_tuples, order_idxs, item_idxs,
+                        grouping)
+
+            orders = orders_by_oid[oid]
+            oid_items = items_by_oid[oid]
+            for order_idx, item_idxs in by_tracking + by_subtotal:
+                items = [oid_items[i] for i in item_idxs]
+                orders[order_idx].set_items(items, assert_unmatched=True)
                 if itemProgress: itemProgress.next(len(items))
-                # Remove the selected items.
-                oid_items = [i for i in oid_items if i not in items]
-        # Remove orders that have items.
-        orders = [o for o in orders if not o.items]
-        if not orders and not oid_items:
-            continue
-
-        orders = sorted(orders, key=lambda o: o.subtotal)
-
-        # Partition the remaining items into every possible arrangement and
-        # validate against the remaining orders.
-        # TODO: Make a custom algorithm with backtracking.
-
-        # The number of combinations are factorial, so limit the number of
-        # attempts (by a 1 sec timeout) before giving up.
-        try:
-            with timeout(1, exception=RuntimeError):
-                for item_groupings in algorithm_u(oid_items, len(orders)):
-                    subtotals_with_groupings = sorted(
-                        [(Item.sum_subtotals(itms), itms)
-                         for itms in item_groupings],
-                        key=lambda g: g[0])
-                    if all([micro_usd_nearly_equal(
-                            subtotals_with_groupings[i][0],
-                            orders[i].subtotal) for i in range(len(orders))]):
-                        for idx, order in enumerate(orders):
-                            items = subtotals_with_groupings[idx][1]
-                            order.set_items(items,
-                                            assert_unmatched=True)
-                            if itemProgress: itemProgress.next(len(items))
-                        break
-        except RuntimeError:
-            pass
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return over_budget
+
+
+def get_tax_rate(subtotal_tax, subtotal):
+    """The tax rate as a percentage, to a tenth of a percent."""
+    return round(subtotal_tax * 100.0 / subtotal, 1)
+
+
+def spread_tax_diff(subtotals, taxes, tax_diff):
+    """Returns how much of tax_diff to add to each of taxes (the per item
+    tax of items with those subtotals).
+
+    Each whole cent goes to the item with the lowest (non-zero) tax rate
+    when tax_diff is positive, or comes from the item with the highest
+    rate when negative, one cent at a time with rates recomputed in
+    between; ties go to the first item. Any partial cent left over goes to
+    the first item.
+
+    Rather than rescanning every item for each cent, the rates are kept in
+    a heap, so this takes O((n + cents) log n).
+    """
+    adjustments = [0] * len(taxes)
+    sign = 1 if tax_diff > 0 else -1
+    # Item taxes divided by a quantity are floats; cents are counted whole.
+    num_cents = int(abs(tax_diff) // CENT_MICRO_USD)
+    if num_cents:
+        # A min heap of rates, or of negated rates for the highest rate.
+        heap = [
+            (sign * get_tax_rate(tax, subtotal), idx)
+            for idx, (subtotal, tax) in enumerate(zip(subtotals, taxes))
+            if sign < 0 or get_tax_rate(tax, subtotal) != 0]
+        heapq.heapify(heap)
+        for _ in range(num_cents):
+            _, idx = heapq.heappop(heap)
+            adjustments[idx] += sign * CENT_MICRO_USD
+            rate = get_tax_rate(taxes[idx] + adjustments[idx], subtotals[idx])
+            if sign < 0 or rate != 0:
+                heapq.heappush(heap, (sign * rate, idx))
+    left = tax_diff - sign * num_cents * CENT_MICRO_USD
+    if abs(left) > MICRO_USD_EPS:
+        adjustments[0] += left
+    return adjustments
 
 
 ORDER_MERGE_FIELDS = {
@@ -203,17 +646,66 @@ ORDER_MERGE_FIELDS = {
 
 
 class Order:
-    matched = False
-    items_matched = False
-    trans_id = None
-    items = []
+    # The columns needed for matching and tagging. Everything else is dropped
+    # when parsing a report unless all fields are requested.
+    FIELDS = frozenset([
+        'buyer_name',
+        'order_date',
+        'order_id',
+        'order_status',
+        'ordering_customer_email',
+        'payment_instrument_type',
+        'shipment_date',
+        'shipping_charge',
+        'subtotal',
+        'tax_before_promotions',
+        'tax_charged',
+        'total_charged',
+        'total_promotions',
+        'tracking',
+    ])
+    # Identifies the same shipment across overlapping reports.
+    DEDUPE_FIELDS = (
+        'order_id', 'tracking', 'shipment_date', 'total_charged')
+    # Known fields live in slots; any other columns (e.g. with all fields
+    # requested) go into a __dict__, which is only allocated when needed.
+    __slots__ = tuple(sorted(FIELDS)) + (
+        'items', 'items_matched', 'matched', 'trans_id', '__dict__')
 
     def __init__(self, raw_dict):
-        self.__dict__.update(pythonify_amazon_dict(raw_dict))
+        self.init_fields(pythonify_amazon_dict(raw_dict))
+
+    @classmethod
+    def from_fields(cls, fields):
+        result = cls.__new__(cls)
+        result.init_fields(fields)
+        return result
+
+    def init_fields(self, fields):
+        self.matched = False
+        self.items_matched = False
+        self.trans_id = None
+        self.items = []
+        for name, value in fields.items():
+            setattr(self, name, value)
 
     @classmethod
-    def parse_from_csv(cls, csv_file, progress=None):
-        return parse_from_csv_common(cls, csv_file, progress)
+    def parse_from_csv(
+            cls, csv_file, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_common(
+            cls, csv_file, progress, all_fields, cache, workers)
+
+    @classmethod
+    def parse_from_csv_files(
+            cls, csv_files, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_files_common(
+            cls, csv_files, progress, all_fields, cache, workers)
+
+    @classmethod
+    def iter_from_csv(cls, csv_file, all_fields=False):
+        return iter_from_csv_common(cls, csv_file, all_fields)
 
     @staticmethod
     def sum_subtotals(orders):
@@ -271,7 +763,7 @@ class Order:
 
         self.subtotal += diff
 
-        adjustment = deepcopy(self.items[0])
+        adjustment = copy(self.items[0])
         adjustment.title = 'Misc Charge (Gift wrap, etc)'
         adjustment.category = 'Shopping'
         adjustment.quantity = 1
@@ -314,38 +806,22 @@ class Order:
         # and most of the time it's simply a rounding error. To keep the line
         # items adding up correctly, spread the tax difference across the
         # items.
-        tax_rate_per_item = [
-            round(i.item_subtotal_tax * 100.0 / i.item_subtotal, 1)
-            for i in self.items]
-        while abs(tax_diff) > MICRO_USD_EPS:
-            if abs(tax_diff) < CENT_MICRO_USD:
-                # If the difference is under a penny, round that
-                # partial cent to the first item.
-                adjust_amount = tax_diff
-                adjust_idx = 0
-            elif tax_diff > 0:
-                adjust_idx = None
-                min_rate = None
-                for (idx, rate) in enumerate(tax_rate_per_item):
-                    if rate != 0 and (not min_rate or rate < min_rate):
-                        adjust_idx = idx
-                        min_rate = rate
-                adjust_amount = CENT_MICRO_USD
-            else:
-                # Find the highest taxed item (by rate) and discount it
-                # a penny.
-                (adjust_idx, _) = max(
-                    enumerate(tax_rate_per_item), key=lambda x: x[1])
-                adjust_amount = -CENT_MICRO_USD
-
-            self.items[adjust_idx].item_subtotal_tax += adjust_amount
-            self.items[adjust_idx].item_total += adjust_amount
-            tax_diff -= adjust_amount
-            tax_rate_per_item[adjust_idx] = round(
-                self.items[adjust_idx].item_subtotal_tax * 100.0 /
-                self.items[adjust_idx].item_subtotal, 1)
+        adjustments = spread_tax_diff(
+            [i.item_subtotal for i in self.items],
+            [i.item_subtotal_tax for i in self.items],
+            tax_diff)
+        for i, adjustment in zip(self.items, adjustments):
+            i.item_subtotal_tax += adjustment
+            i.item_total += adjustment
         return True
 
+    @staticmethod
+    def attribute_itemized_diffs_to_per_item_tax(orders):
+        """Does attribute_itemized_diff_to_per_item_tax for each of orders,
+        one order at a time. Returns how many were adjusted."""
+        return len([
+            o for o in orders if o.attribute_itemized_diff_to_per_item_tax()])
+
     def to_mint_transactions(self,
                              t,
                              skip_free_shipping=False):
@@ -413,7 +889,7 @@ class Order:
         result = deepcopy(orders[0])
         result.set_items(Item.merge([i for o in orders for i in o.items]))
         for key in ORDER_MERGE_FIELDS:
-            result.__dict__[key] = sum([o.__dict__[key] for o in orders])
+            setattr(result, key, sum([getattr(o, key) for o in orders]))
         return result
 
     def __repr__(self):
@@ -432,16 +908,58 @@ class Order:
 
 
 class Item:
-    matched = False
-    order = None
+    FIELDS = frozenset([
+        'asin_isbn',
+        'category',
+        'item_subtotal',
+        'item_subtotal_tax',
+        'item_total',
+        'order_date',
+        'order_id',
+        'order_status',
+        'purchase_price_per_unit',
+        'quantity',
+        'shipment_date',
+        'title',
+        'tracking',
+    ])
+    DEDUPE_FIELDS = ('order_id', 'tracking', 'asin_isbn', 'shipment_date')
+    __slots__ = tuple(sorted(FIELDS)) + (
+        'matched', 'order', 'original_item_subtotal_tax', '__dict__')
 
     def __init__(self, raw_dict):
-        self.__dict__.update(pythonify_amazon_dict(raw_dict))
-        self.__dict__['original_item_subtotal_tax'] = self.item_subtotal_tax
+        self.init_fields(pythonify_amazon_dict(raw_dict))
+
+    @classmethod
+    def from_fields(cls, fields):
+        result = cls.__new__(cls)
+        result.init_fields(fields)
+        return result
+
+    def init_fields(self, fields):
+        self.matched = False
+        self.order = None
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.original_item_subtotal_tax = self.item_subtotal_tax
+
+    @classmethod
+    def parse_from_csv(
+            cls, csv_file, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_common(
+            cls, csv_file, progress, all_fields, cache, workers)
 
     @classmethod
-    def parse_from_csv(cls, csv_file, progress=None):
-        return parse_from_csv_common(cls, csv_file, progress)
+    def parse_from_csv_files(
+            cls, csv_files, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_files_common(
+            cls, csv_files, progress, all_fields, cache, workers)
+
+    @classmethod
+    def iter_from_csv(cls, csv_file, all_fields=False):
+        return iter_from_csv_common(cls, csv_file, all_fields)
 
     @staticmethod
     def sum_subtotals(items):
@@ -477,36 +995,41 @@ class Item:
         self.item_total = self.item_subtotal + self.item_subtotal_tax
         self.quantity = new_quantity
 
+    def with_quantity(self, quantity):
+        """Returns a copy of this item with quantity units."""
+        item = copy(self)
+        item.set_quantity(quantity)
+        return item
+
     def split_by_quantity(self):
-        """Splits this item into 'quantity' items."""
+        """Splits this item into 'quantity' single unit views of itself."""
         if self.quantity == 1:
             return [self]
-        orig_qty = self.quantity
-        self.set_quantity(1)
-        return [deepcopy(self) for i in range(orig_qty)]
+        return [ItemUnit(self, i) for i in range(self.quantity)]
 
     @classmethod
     def merge(cls, items):
-        """Collapses identical items by using quantity."""
-        if len(items) < 2:
+        """Collapses identical items by using quantity.
+
+        Always returns standalone Items (never ItemUnit views), so the
+        results can be adjusted without affecting any other item.
+        """
+        if len(items) < 2 and not any(
+                isinstance(i, ItemUnit) for i in items):
             return items
-        unique_items = defaultdict(list)
+        unique_items = {}
         for i in items:
-            key = '{}-{}-{}'.format(
-                i.title,
-                i.asin_isbn,
-                i.item_subtotal)
-            unique_items[key].append(i)
+            key = (i.title, i.asin_isbn, i.item_subtotal)
+            if key in unique_items:
+                unique_items[key][1] += i.quantity
+            else:
+                unique_items[key] = [i, i.quantity]
         results = []
-        for same_items in unique_items.values():
-            qty = sum([i.quantity for i in same_items])
-            if qty == 1:
-                results.extend(same_items)
-                continue
-
-            item = deepcopy(same_items[0])
-            item.set_quantity(qty)
-            results.append(item)
+        for item, qty in unique_items.values():
+            if qty == 1 and not isinstance(item, ItemUnit):
+                results.append(item)
+            else:
+                results.append(item.with_quantity(qty))
         return results
 
     def __repr__(self):
@@ -520,24 +1043,111 @@ class Item:
                 desc=self.title))
 
 
+class ItemUnit:
+    """A single unit of a multi-quantity Item.
+
+    Units share every field with their base item; only the per-unit prices
+    differ, and those are derived on demand. This keeps splitting an item of
+    quantity N to N small objects rather than N copies of the item.
+    """
+
+    __slots__ = ('base', 'index', 'matched', 'order')
+
+    quantity = 1
+
+    def __init__(self, base, index):
+        self.base = base
+        self.index = index
+        self.matched = False
+        self.order = None
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't on the unit itself.
+        if name == 'base' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    @property
+    def item_subtotal(self):
+        return self.base.purchase_price_per_unit
+
+    @property
+    def item_subtotal_tax(self):
+        return self.base.item_subtotal_tax / self.base.quantity
+
+    @property
+    def item_total(self):
+        return self.item_subtotal + self.item_subtotal_tax
+
+    def get_title(self, target_length=100):
+        return get_title(self, target_length)
+
+    def with_quantity(self, quantity):
+        """Returns a standalone Item with quantity units of the base item."""
+        item = self.base.with_quantity(quantity)
+        item.matched = self.matched
+        item.order = self.order
+        return item
+
+    __repr__ = Item.__repr__
+
+
 class Refund:
-    matched = False
-    trans_id = None
+    FIELDS = frozenset([
+        'asin_isbn',
+        'buyer_name',
+        'category',
+        'order_date',
+        'order_id',
+        'quantity',
+        'refund_amount',
+        'refund_date',
+        'refund_reason',
+        'refund_tax_amount',
+        'title',
+    ])
+    DEDUPE_FIELDS = ('order_id', 'asin_isbn', 'refund_date', 'refund_amount')
+    __slots__ = tuple(sorted(FIELDS)) + (
+        'matched', 'total_refund_amount', 'trans_id', '__dict__')
 
     def __init__(self, raw_dict):
+        self.init_fields(pythonify_amazon_dict(raw_dict))
+
+    @classmethod
+    def from_fields(cls, fields):
+        result = cls.__new__(cls)
+        result.init_fields(fields)
+        return result
+
+    def init_fields(self, fields):
         # Refunds are rad: AMZN doesn't total the tax + sub-total for you.
-        fields = pythonify_amazon_dict(raw_dict)
-        fields['total_refund_amount'] = (
-            fields['refund_amount'] + fields['refund_tax_amount'])
-        self.__dict__.update(fields)
+        self.matched = False
+        self.trans_id = None
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.total_refund_amount = self.refund_amount + self.refund_tax_amount
 
     @staticmethod
     def sum_total_refunds(refunds):
         return sum([r.total_refund_amount for r in refunds])
 
     @classmethod
-    def parse_from_csv(cls, csv_file, progress=None):
-        return parse_from_csv_common(cls, csv_file, progress)
+    def parse_from_csv(
+            cls, csv_file, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_common(
+            cls, csv_file, progress, all_fields, cache, workers)
+
+    @classmethod
+    def parse_from_csv_files(
+            cls, csv_files, progress=None, all_fields=False, cache=None,
+            workers=1):
+        return parse_from_csv_files_common(
+            cls, csv_files, progress, all_fields, cache, workers)
+
+    @classmethod
+    def iter_from_csv(cls, csv_file, all_fields=False):
+        return iter_from_csv_common(cls, csv_file, all_fields)
 
     def match(self, trans):
         self.matched = True
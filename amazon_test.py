@@ -1,9 +1,18 @@
 from datetime import date
+import gzip
+import io
+import lzma
+import os
+import random
+import tempfile
 import unittest
+import zipfile
 
 import amazon
 from amazon import Item, Order, Refund
-from mockdata import item, order, refund, transaction
+from currency import micro_usd_to_usd_string
+from mockdata import csv_file, item, order, refund, transaction
+from mockdata import item_dict, order_dict, refund_dict
 
 
 class HelperMethods(unittest.TestCase):
@@ -25,6 +34,39 @@ class HelperMethods(unittest.TestCase):
             amazon.parse_amazon_date('1/23/1989'),
             date(1989, 1, 23))
 
+    def test_csv_schema(self):
+        schema = amazon.CsvSchema([
+            'Order ID', 'Carrier Name & Tracking Number', 'ASIN/ISBN',
+            'Item Total', 'Shipment Date', 'Quantity'])
+
+        self.assertEqual(
+            schema.names,
+            ('order_id', 'tracking', 'asin_isbn', 'item_total',
+             'shipment_date', 'quantity'))
+        self.assertEqual(
+            schema.pythonify(['A', 'UPS(1Z)', 'B00', '$1.23', '2/3/14', '2']),
+            {'order_id': 'A',
+             'tracking': 'UPS(1Z)',
+             'asin_isbn': 'B00',
+             'item_total': 1230000,
+             'shipment_date': date(2014, 2, 3),
+             'quantity': 2})
+
+    def test_csv_schema_pythonify_rows(self):
+        schema = amazon.CsvSchema(
+            ['Order ID', 'Item Total', 'Shipment Date', 'Quantity'],
+            fields={'order_id', 'item_total', 'quantity'})
+        rows = [
+            ['A', '$1.23', '2/3/14', '2'],
+            ['B', '$1.23', '2/4/14', '1'],
+        ]
+
+        self.assertEqual(schema.pythonify_rows([]), [])
+        self.assertEqual(
+            schema.pythonify_rows(rows),
+            [{'order_id': 'A', 'item_total': 1230000, 'quantity': 2},
+             {'order_id': 'B', 'item_total': 1230000, 'quantity': 1}])
+
     def test_associate_items_with_orders_none_match(self):
         i1 = item(order_id='1', item_subtotal='$100.00')
         i2 = item(order_id='2')
@@ -123,6 +165,374 @@ class HelperMethods(unittest.TestCase):
         self.assertTrue(o2.items_matched)
         self.assertEqual(len(o2.items), 6)
 
+    def test_associate_items_with_orders_many_items_by_combi(self):
+        prices = ['$19.99', '$24.99', '$9.99', '$45.99', '$129.99', '$3.49']
+        items = [
+            item(order_id='A', item_subtotal=prices[i % 6],
+                 tracking='T{}'.format(i))
+            for i in range(36)
+        ]
+        subtotals = [0] * 5
+        for i, it in enumerate(items):
+            subtotals[i % 5] += it.item_subtotal
+        orders = [
+            order(order_id='A',
+                  subtotal=micro_usd_to_usd_string(s),
+                  tracking='S{}'.format(idx))
+            for idx, s in enumerate(subtotals)
+        ]
+
+        amazon.associate_items_with_orders(orders, items)
+
+        for o, subtotal in zip(orders, subtotals):
+            self.assertTrue(o.items_matched)
+            self.assertEqual(Item.sum_subtotals(o.items), subtotal)
+        self.assertEqual(sum(len(o.items) for o in orders), 36)
+
+    def test_associate_items_with_orders_over_budget(self):
+        def make_orders_and_items(oid, price=2):
+            items = [
+                item(order_id=oid, item_subtotal='${}.00'.format(price),
+                     tracking='A')
+                for i in range(8)
+            ]
+            orders = [
+                order(order_id=oid, subtotal='${}.00'.format(price * 2),
+                      tracking='A'),
+                order(order_id=oid, subtotal='${}.00'.format(price * 6),
+                      tracking='B'),
+            ]
+            return orders, items
+
+        orders, items = make_orders_and_items('A')
+        self.assertEqual(
+            amazon.associate_items_with_orders(
+                orders, items, max_states_per_order=1),
+            [('A', 8, 2)])
+        self.assertFalse(any(o.items_matched for o in orders))
+
+        # The run budget is shared: the first order id leaves too little for
+        # the second.
+        a_orders, a_items = make_orders_and_items('A')
+        b_orders, b_items = make_orders_and_items('B', price=3)
+        over_budget = amazon.associate_items_with_orders(
+            a_orders + b_orders, a_items + b_items, max_states=3)
+        self.assertEqual(over_budget, [('B', 8, 2)])
+        self.assertTrue(all(o.items_matched for o in a_orders))
+        self.assertFalse(any(o.items_matched for o in b_orders))
+
+    def test_associate_items_with_orders_memoizes_partitions(self):
+        def make_orders_and_items(oid):
+            items = [
+                item(order_id=oid, item_subtotal=price, tracking='A')
+                for price in ('$2.00', '$5.00', '$3.00', '$1.00')
+            ]
+            orders = [
+                order(order_id=oid, subtotal='$6.00', tracking='A'),
+                order(order_id=oid, subtotal='$5.00', tracking='B'),
+            ]
+            return orders, items
+
+        memo = {}
+        a_orders, a_items = make_orders_and_items('A')
+        b_orders, b_items = make_orders_and_items('B')
+        # Repeat orders of the same shape are only searched once, so the
+        # second one doesn't need any budget.
+        self.assertEqual(
+            amazon.associate_items_with_orders(
+                a_orders + b_orders, a_items + b_items,
+                max_states=5, partition_memo=memo),
+            [])
+        self.assertEqual(
+            memo,
+            {((1000000, 2000000, 3000000, 5000000), (5000000, 6000000)):
+             [1, 1, 1, 0]})
+
+        for orders, items in ((a_orders, a_items), (b_orders, b_items)):
+            self.assertEqual(orders[0].items, [items[0], items[2], items[3]])
+            self.assertEqual(orders[1].items, [items[1]])
+
+        # Memoized partitions are mapped back onto the items in any order.
+        c_orders, c_items = make_orders_and_items('C')
+        c_orders.reverse()
+        c_items.reverse()
+        self.assertEqual(
+            amazon.associate_items_with_orders(
+                c_orders, c_items, max_states=0, partition_memo=memo),
+            [])
+        self.assertEqual(c_orders[0].items, [c_items[2]])
+        self.assertEqual(
+            c_orders[1].items, [c_items[0], c_items[1], c_items[3]])
+
+    def test_associate_items_with_orders_parallel_equals_serial(self):
+        prices = ['$19.99', '$24.99', '$9.99', '$45.99', '$129.99', '$3.49']
+
+        def make_orders_and_items():
+            all_orders = []
+            all_items = []
+            for oid_idx in range(6):
+                oid = 'O{}'.format(oid_idx)
+                num_shipments = 1 + oid_idx % 3
+                items = [
+                    item(order_id=oid, item_subtotal=prices[i % 6],
+                         tracking='T{}'.format(i))
+                    for i in range(4 + oid_idx * 3)
+                ]
+                subtotals = [0] * num_shipments
+                for i, it in enumerate(items):
+                    subtotals[i % num_shipments] += it.item_subtotal
+                all_orders.extend(
+                    order(order_id=oid,
+                          subtotal=micro_usd_to_usd_string(s),
+                          tracking='S{}'.format(idx))
+                    for idx, s in enumerate(subtotals))
+                all_items.extend(items)
+            return all_orders, all_items
+
+        def get_assignment(orders, items):
+            return [[items.index(i) for i in o.items] for o in orders]
+
+        for max_states in (None, 20, 0):
+            serial_orders, serial_items = make_orders_and_items()
+            serial_over_budget = amazon.associate_items_with_orders(
+                serial_orders, serial_items, max_states=max_states)
+            parallel_orders, parallel_items = make_orders_and_items()
+            parallel_over_budget = amazon.associate_items_with_orders(
+                parallel_orders, parallel_items, max_states=max_states,
+                workers=2)
+
+            self.assertEqual(serial_over_budget, parallel_over_budget)
+            self.assertEqual(
+                get_assignment(serial_orders, serial_items),
+                get_assignment(parallel_orders, parallel_items))
+            if max_states is None:
+                self.assertEqual(serial_over_budget, [])
+                self.assertTrue(all(o.items_matched for o in serial_orders))
+
+
+def spread_tax_diff_one_cent_at_a_time(subtotals, taxes, tax_diff):
+    """How tax differences used to be spread."""
+    taxes = list(taxes)
+    rates = [round(t * 100.0 / s, 1) for s, t in zip(subtotals, taxes)]
+    while abs(tax_diff) > 50:
+        if abs(tax_diff) < 10000:
+            adjust_amount = tax_diff
+            adjust_idx = 0
+        elif tax_diff > 0:
+            adjust_idx = None
+            min_rate = None
+            for idx, rate in enumerate(rates):
+                if rate != 0 and (not min_rate or rate < min_rate):
+                    adjust_idx = idx
+                    min_rate = rate
+            adjust_amount = 10000
+        else:
+            adjust_idx, _ = max(enumerate(rates), key=lambda x: x[1])
+            adjust_amount = -10000
+        taxes[adjust_idx] += adjust_amount
+        tax_diff -= adjust_amount
+        rates[adjust_idx] = round(
+            taxes[adjust_idx] * 100.0 / subtotals[adjust_idx], 1)
+    return taxes
+
+
+class SpreadTaxDiff(unittest.TestCase):
+    def test_same_as_one_cent_at_a_time(self):
+        rand = random.Random(11)
+        for _ in range(200):
+            num_items = rand.randint(1, 30)
+            subtotals = [
+                rand.randint(1, 5000) * 10000 for _ in range(num_items)]
+            taxes = [
+                s * rand.choice([0, 0, 6, 7, 8.25, 9.5]) // 100 // 10000 *
+                10000 for s in subtotals]
+            # Some item must be taxed to take the pennies.
+            taxes[0] = subtotals[0] // 10
+            tax_diff = rand.randint(-500, 500) * 10000 + rand.choice(
+                [0, 0, 30, 70, -70])
+
+            adjustments = amazon.spread_tax_diff(subtotals, taxes, tax_diff)
+            self.assertEqual(
+                [t + a for t, a in zip(taxes, adjustments)],
+                spread_tax_diff_one_cent_at_a_time(
+                    subtotals, taxes, tax_diff))
+
+
+class ParseFromCsv(unittest.TestCase):
+    def test_parse_from_csv_empty_report(self):
+        header = list(order_dict().keys())
+        self.assertEqual(
+            Order.parse_from_csv(csv_file([], no_data_header=header)), [])
+        header = list(item_dict().keys())
+        self.assertEqual(
+            Item.parse_from_csv(csv_file([], no_data_header=header)), [])
+
+    def test_parse_from_csv_single_order(self):
+        orders = Order.parse_from_csv(csv_file([order_dict()]))
+
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0].order_id, '123-3211232-7655671')
+        self.assertEqual(orders[0].total_charged, 11950000)
+        self.assertEqual(orders[0].tracking, 'AMZN(ABC123)')
+
+    def test_parse_from_csv_multiline_title(self):
+        items = Item.parse_from_csv(csv_file([
+            item_dict(title='Two\nlines'),
+            item_dict(title='Another'),
+        ]))
+
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0].title, 'Two\nlines')
+        self.assertEqual(items[1].title, 'Another')
+
+    def test_parse_from_csv_blank_lines(self):
+        content = csv_file([order_dict()]).getvalue()
+        orders = Order.parse_from_csv(io.StringIO(content + '\r\n'))
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0].total_charged, 11950000)
+
+        header, record = content.split('\r\n', 1)
+        orders = Order.parse_from_csv(
+            io.StringIO(header + '\r\n\r\n' + record + '\r\n' + record))
+        self.assertEqual(len(orders), 2)
+
+    def test_parse_from_csv_projection(self):
+        items = Item.parse_from_csv(csv_file([item_dict()]))
+        self.assertEqual(items[0].item_total, 11950000)
+        self.assertFalse(hasattr(items[0], 'unspsc_code'))
+        self.assertFalse(hasattr(items[0], 'shipping_address_zip'))
+
+        items = Item.parse_from_csv(
+            csv_file([item_dict()]), all_fields=True)
+        self.assertEqual(items[0].item_total, 11950000)
+        self.assertEqual(items[0].unspsc_code, '26111700')
+        self.assertEqual(items[0].shipping_address_zip, '98101-1001')
+
+    def test_split_csv_records(self):
+        content = (
+            'Title,Total\n'
+            '"Multi\nline ""quoted"" title",$1.00\n'
+            'Short,$2.00\n'
+            '"Another\n\nmulti",$3.00\n'
+            'Last,$4.00\n')
+        for num_chunks in range(1, 8):
+            header, ranges = amazon.split_csv_records(content, num_chunks)
+            self.assertEqual(header, 'Title,Total\n')
+            self.assertTrue(len(ranges) <= num_chunks)
+            self.assertEqual(''.join(content[s:e] for s, e in ranges),
+                             content[len(header):])
+            for start, end in ranges:
+                self.assertEqual(
+                    amazon.find_record_start(content, start - 1), start)
+
+    def test_parse_fields_from_csv_parallel(self):
+        report = [
+            item_dict(title='Item {}\nwith a second line'.format(i))
+            for i in range(50)]
+        content = csv_file(report).getvalue()
+
+        serial = list(amazon.iter_fields_from_csv(
+            csv_file(report), Item.FIELDS))
+        parallel = amazon.parse_fields_from_csv_parallel(
+            content, Item.FIELDS, 3)
+        self.assertEqual(len(parallel), 50)
+        self.assertEqual(parallel, serial)
+
+    def test_parse_fields_from_csv_parallel_blank_lines(self):
+        report = [item_dict(title='Item {}'.format(i)) for i in range(50)]
+        content = csv_file(report).getvalue().replace('\r\n', '\r\n\r\n')
+
+        serial = list(amazon.iter_fields_from_csv(
+            io.StringIO(content, newline=''), Item.FIELDS))
+        parallel = amazon.parse_fields_from_csv_parallel(
+            content, Item.FIELDS, 3)
+        self.assertEqual(len(serial), 50)
+        self.assertEqual(parallel, serial)
+
+    def test_open_report_stream_compressed(self):
+        report = [item_dict(title='Ünicode\nand newlines')]
+        content = csv_file(report).getvalue()
+        raw = content.encode('utf-8')
+
+        zipped = io.BytesIO()
+        with zipfile.ZipFile(zipped, 'w') as archive:
+            archive.writestr('README.txt', 'Not the report')
+            archive.writestr('Items.csv', raw)
+
+        for data in [
+                raw,
+                b'\xef\xbb\xbf' + raw,
+                gzip.compress(raw),
+                lzma.compress(raw),
+                zipped.getvalue()]:
+            stream = amazon.open_report_stream(io.BytesIO(data))
+            self.assertEqual(stream.read(), content)
+
+            items = Item.parse_from_csv(
+                amazon.open_report_stream(io.BytesIO(data)))
+            self.assertEqual(len(items), 1)
+            self.assertEqual(items[0].title, 'Ünicode\nand newlines')
+
+    def test_open_report(self):
+        content = csv_file([order_dict()]).getvalue()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'Orders.csv.gz')
+            with gzip.open(path, 'wt', newline='') as f:
+                f.write(content)
+
+            with amazon.open_report(path) as f:
+                orders = Order.parse_from_csv(f)
+            self.assertEqual(len(orders), 1)
+            self.assertEqual(orders[0].total_charged, 11950000)
+
+    def test_parse_from_csv_files_dedupes(self):
+        account1_2017 = [
+            item_dict(order_id='A', title='Batteries'),
+            item_dict(order_id='B', title='Cable'),
+            item_dict(order_id='B', title='Cable'),
+        ]
+        account1_2017_2018 = [
+            item_dict(order_id='B', title='Cable'),
+            item_dict(order_id='B', title='Cable'),
+            item_dict(order_id='B', title='Cable'),
+            item_dict(order_id='C', title='Lamp'),
+        ]
+        account2 = [
+            item_dict(order_id='D', title='Batteries'),
+        ]
+
+        items = Item.parse_from_csv_files([
+            csv_file(account1_2017),
+            csv_file(account1_2017_2018),
+            csv_file(account2),
+        ])
+
+        self.assertEqual(
+            [(i.order_id, i.title) for i in items],
+            [('A', 'Batteries'),
+             ('B', 'Cable'),
+             ('B', 'Cable'),
+             ('B', 'Cable'),
+             ('C', 'Lamp'),
+             ('D', 'Batteries')])
+
+    def test_parse_from_csv_records_are_slotted(self):
+        orders = Order.parse_from_csv(csv_file([order_dict()]))
+        self.assertEqual(orders[0].__dict__, {})
+
+        orders = Order.parse_from_csv(
+            csv_file([order_dict()]), all_fields=True)
+        self.assertEqual(
+            orders[0].__dict__['shipping_address_city'], 'SEATTLE')
+
+    def test_iter_from_csv_is_lazy(self):
+        f = csv_file([refund_dict(), refund_dict(), refund_dict()])
+        refunds = Refund.iter_from_csv(f)
+
+        first = next(refunds)
+        self.assertEqual(first.total_refund_amount, 11950000)
+        self.assertEqual(len(list(refunds)), 2)
+
 
 class OrderClass(unittest.TestCase):
     def test_constructor(self):
@@ -349,6 +759,75 @@ class OrderClass(unittest.TestCase):
         self.assertEqual(i.item_subtotal, 9000000)
         self.assertEqual(i.item_subtotal_tax, 1000000)
 
+    def test_attribute_itemized_diff_to_per_item_tax_many_items(self):
+        o = order(
+            total_charged='$32.53',
+            subtotal='$30.00',
+            tax_charged='$2.53')
+        i1 = item(
+            item_total='$10.80',
+            item_subtotal='$10.00',
+            item_subtotal_tax='$0.80')
+        i2 = item(
+            item_total='$10.90',
+            item_subtotal='$10.00',
+            item_subtotal_tax='$0.90')
+        i3 = item(
+            item_total='$10.80',
+            item_subtotal='$10.00',
+            item_subtotal_tax='$0.80')
+        o.set_items([i1, i2, i3])
+
+        self.assertTrue(o.attribute_itemized_diff_to_per_item_tax())
+        # The lowest rates get the pennies, the first item on a tie.
+        self.assertEqual(i1.item_subtotal_tax, 820000)
+        self.assertEqual(i2.item_subtotal_tax, 900000)
+        self.assertEqual(i3.item_subtotal_tax, 810000)
+        self.assertEqual(i1.item_total, 10820000)
+        self.assertEqual(o.total_by_items(), o.total_charged)
+
+    def test_attribute_itemized_diff_to_per_item_tax_quantity(self):
+        o = order(
+            total_charged='$10.83',
+            subtotal='$10.00',
+            tax_charged='$0.83')
+        i = item(
+            item_total='$21.61',
+            item_subtotal='$20.00',
+            item_subtotal_tax='$1.61',
+            purchase_price_per_unit='$10.00',
+            quantity=2)
+        # Dividing the tax by the quantity leaves a float tax.
+        i.set_quantity(1)
+        o.set_items([i])
+
+        self.assertTrue(o.attribute_itemized_diff_to_per_item_tax())
+        self.assertEqual(i.item_subtotal_tax, 830000)
+        self.assertEqual(i.item_total, 10830000)
+
+    def test_attribute_itemized_diffs_to_per_item_tax(self):
+        o1 = order(
+            total_charged='$10.00',
+            subtotal='$9.00',
+            tax_charged='$1.00')
+        o1.set_items([item(
+            item_total='$9.99',
+            item_subtotal='$9.00',
+            item_subtotal_tax='$0.99')])
+        o2 = order(
+            total_charged='$10.00',
+            subtotal='$9.00',
+            tax_charged='$1.00')
+        o2.set_items([item(
+            item_total='$10.00',
+            item_subtotal='$9.00',
+            item_subtotal_tax='$1.00')])
+
+        self.assertEqual(
+            Order.attribute_itemized_diffs_to_per_item_tax([o1, o2]), 1)
+        self.assertEqual(o1.items[0].item_subtotal_tax, 1000000)
+        self.assertEqual(o2.items[0].item_subtotal_tax, 1000000)
+
     def test_to_mint_transactions_free_shipping(self):
         orig_trans = transaction(amount='$20.00')
 
@@ -545,6 +1024,41 @@ class ItemClass(unittest.TestCase):
             self.assertEqual(it.item_subtotal, 5450000)
             self.assertEqual(it.item_subtotal_tax, 525000)
             self.assertEqual(it.item_total, 5975000)
+            self.assertEqual(it.title, 'Duracell AAs')
+            self.assertEqual(it.get_title(), 'Duracell AAs')
+            self.assertTrue(it.base is i)
+
+        # The base item is untouched.
+        self.assertEqual(i.quantity, 2)
+        self.assertEqual(i.item_total, 11950000)
+
+        single = item(quantity=1)
+        self.assertEqual(single.split_by_quantity(), [single])
+
+    def test_merge_units(self):
+        i = item(quantity=500, item_subtotal='$2725.00',
+                 item_subtotal_tax='$262.50', item_total='$2987.50')
+        units = i.split_by_quantity()
+
+        o = order()
+        o.set_items(units[:3])
+        merged = Item.merge(o.items)
+        self.assertEqual(len(merged), 1)
+        self.assertTrue(isinstance(merged[0], Item))
+        self.assertEqual(merged[0].quantity, 3)
+        self.assertEqual(merged[0].item_subtotal, 16350000)
+        self.assertEqual(merged[0].item_subtotal_tax, 1575000)
+        self.assertEqual(merged[0].item_total, 17925000)
+        self.assertTrue(merged[0].order is o)
+
+        merged = Item.merge(units[3:4])
+        self.assertTrue(isinstance(merged[0], Item))
+        self.assertEqual(merged[0].quantity, 1)
+        self.assertEqual(merged[0].item_total, 5975000)
+
+        # Adjusting the merged item doesn't affect the base.
+        merged[0].item_subtotal_tax += 10000
+        self.assertEqual(i.item_subtotal_tax, 262500000)
 
     def test_merge(self):
         i1 = item()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# Micro-benchmarks for the tagger's hot spots, run on synthetic data. Pick a
+# benchmark by name, e.g.:
+#   ./benchmark.py memory --num_records 100000
+#   ./benchmark.py partition
+#   ./benchmark.py matching --num_records 1000000
+#   ./benchmark.py matching_scaling --num_records 100000
+
+import argparse
+from datetime import date, timedelta
+import random
+import time
+import tracemalloc
+
+from algorithm_u import algorithm_u
+import amazon
+from currency import micro_usd_nearly_equal
+import matching
+import mockdata
+from partition import partition_by_subtotals
+
+
+def measure_memory(build):
+    """Returns what build() returns and the bytes it allocated to do so."""
+    tracemalloc.start()
+    result = build()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated
+
+
+def synthetic_item_fields(num_records):
+    schema = amazon.CsvSchema(mockdata.item_dict().keys(), amazon.Item.FIELDS)
+    return [
+        schema.pythonify(list(mockdata.item_dict(
+            order_id='{:03d}-{:07d}-{:07d}'.format(i % 997, i, i * 7),
+            title='Item number {}'.format(i),
+            quantity=1 + i % 3).values()))
+        for i in range(num_records)]
+
+
+class DictRecord:
+    """Stores its fields in a per-object dict, like records without
+    __slots__ do."""
+
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+
+def bench_memory(args):
+    fields = synthetic_item_fields(args.num_records)
+
+    dict_records, dict_bytes = measure_memory(
+        lambda: [DictRecord(f) for f in fields])
+    del dict_records
+    slot_records, slot_bytes = measure_memory(
+        lambda: [amazon.Item.from_fields(f) for f in fields])
+
+    print('{} records: __dict__ {:.0f} bytes/record, __slots__ {:.0f} '
+          'bytes/record ({:.1f}x smaller)'.format(
+              args.num_records,
+              dict_bytes / args.num_records,
+              slot_bytes / args.num_records,
+              dict_bytes / slot_bytes))
+
+
+def synthetic_shipments(num_items, num_shipments, num_distinct, seed=0):
+    """Returns item subtotals and the shipment subtotals they add up to."""
+    rand = random.Random(seed)
+    prices = [rand.randint(100, 20000) * 10000 for _ in range(num_distinct)]
+    items = [rand.choice(prices) for _ in range(num_items)]
+    shipment_of_item = [i % num_shipments for i in range(num_items)]
+    rand.shuffle(shipment_of_item)
+    subtotals = [0] * num_shipments
+    for item, shipment in zip(items, shipment_of_item):
+        subtotals[shipment] += item
+    return items, subtotals
+
+
+def partition_with_algorithm_u(items, subtotals):
+    """How associate_items_with_orders used to partition items."""
+    subtotals = sorted(subtotals)
+    for groupings in algorithm_u(items, len(subtotals)):
+        sums = sorted(sum(g) for g in groupings)
+        if all(micro_usd_nearly_equal(s, t) for s, t in zip(sums, subtotals)):
+            return groupings
+    return None
+
+
+def time_call(fn, *args):
+    start_time = time.time()
+    fn(*args)
+    return time.time() - start_time
+
+
+def bench_partition(args):
+    # algorithm_u enumerates every set partition, so keep it to small orders.
+    for num_items in range(6, 15, 2):
+        items, subtotals = synthetic_shipments(num_items, 3, num_items // 2)
+        print('{} items / 3 shipments: algorithm_u {:.4f}s, '
+              'partition {:.4f}s'.format(
+                  num_items,
+                  time_call(partition_with_algorithm_u, items, subtotals),
+                  time_call(partition_by_subtotals, items, subtotals)))
+    for num_items, num_distinct in [(30, 6), (36, 12), (32, 32), (40, 40)]:
+        items, subtotals = synthetic_shipments(num_items, 5, num_distinct)
+        print('{} items ({} distinct) / 5 shipments: partition '
+              '{:.4f}s'.format(
+                  num_items, num_distinct,
+                  time_call(partition_by_subtotals, items, subtotals)))
+
+
+class SyntheticOrder:
+    """Just enough of an Order to be matched."""
+
+    def __init__(self, amount, when):
+        self.amount = amount
+        self.when = when
+        self.matched = False
+
+    def transact_amount(self):
+        return self.amount
+
+    def transact_date(self):
+        return self.when
+
+
+class SyntheticTransaction:
+    def __init__(self, amount, odate):
+        self.amount = amount
+        self.odate = odate
+
+
+def synthetic_orders_and_trans(num_records, seed=0):
+    """Years of orders, mostly at a few subscription prices, each charged a
+    few days from shipping."""
+    rand = random.Random(seed)
+    prices = [999, 1499, 2499] + list(range(100, 50000, 37))
+    first_day = date(2010, 1, 1)
+    orders = []
+    trans = []
+    for i in range(num_records):
+        price = prices[min(int(rand.expovariate(0.05)), len(prices) - 1)]
+        when = first_day + timedelta(days=rand.randrange(10 * 365))
+        orders.append(SyntheticOrder(price * 10000, when))
+        trans.append(SyntheticTransaction(
+            price * 10000, when + timedelta(days=rand.randint(-2, 2))))
+    rand.shuffle(trans)
+    return orders, trans
+
+
+def match_amounts_python(trans, orders):
+    """Matches like the python engine, leaving orders unmatched."""
+    index = matching.MatchIndex((o.transact_amount(), [o]) for o in orders)
+    matches = []
+    for t in trans:
+        group = index.pop_best(t.amount, t.odate)
+        matches.append(group[0] if group else None)
+        if group:
+            group[0].matched = True
+    for o in orders:
+        o.matched = False
+    return matches
+
+
+def bench_matching(args):
+    orders, trans = synthetic_orders_and_trans(args.num_records)
+    start_time = time.time()
+    python_matches = match_amounts_python(trans, orders)
+    python_s = time.time() - start_time
+
+    numpy_str = 'numpy not installed'
+    if matching.np is not None:
+        start_time = time.time()
+        numpy_matches = matching.match_amounts_numpy(trans, orders)
+        numpy_str = 'numpy {:.2f}s'.format(time.time() - start_time)
+        assert numpy_matches == python_matches
+
+    start_time = time.time()
+    optimal_matches = matching.match_amounts_optimal(trans, orders)
+    optimal_s = time.time() - start_time
+
+    print('{} orders and transactions ({} matched): python {:.2f}s, {}; '
+          '{} matched by optimal in {:.2f}s'.format(
+              args.num_records,
+              len([m for m in python_matches if m]),
+              python_s, numpy_str,
+              len([m for m in optimal_matches if m]),
+              optimal_s))
+
+
+def bench_matching_scaling(args):
+    # Doubling the history should about double the time of both engines.
+    for num_records in (args.num_records // 4, args.num_records // 2,
+                        args.num_records, args.num_records * 2):
+        orders, trans = synthetic_orders_and_trans(num_records)
+        python_s = time_call(match_amounts_python, trans, orders)
+        optimal_s = time_call(matching.match_amounts_optimal, trans, orders)
+        print('{} records: python {:.2f}us/record, optimal {:.2f}us/record'
+              .format(num_records,
+                      python_s * 1e6 / num_records,
+                      optimal_s * 1e6 / num_records))
+
+
+BENCHMARKS = {
+    'matching': bench_matching,
+    'matching_scaling': bench_matching_scaling,
+    'memory': bench_memory,
+    'partition': bench_partition,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tagger on synthetic data.')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument(
+        '--num_records', type=int, default=100000,
+        help='How many synthetic records to generate.')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    BENCHMARKS[args.benchmark](args)
+    print('Took {:.2f}s'.format(time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.mint-amazon-tagger-cache')
+
+# Parsed report snapshots are pruned beyond this total size or age.
+DEFAULT_REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_REPORT_CACHE_MAX_AGE_S = 90 * 24 * 60 * 60
+
+REPORT_SNAPSHOT_SUFFIX = '.snapshot'
+
+# Memoized results beyond this many are dropped, least recently used first.
+DEFAULT_MEMO_MAX_ENTRIES = 100000
+
+# A memo at least this full is written back when lookups alone reorder it,
+# as its next new entries may evict the least recently used ones.
+MEMO_SAVE_ORDER_FULLNESS = 0.9
+
+
+class ReportCache:
+    """An on-disk cache of parsed Amazon reports.
+
+    Entries are keyed by the hash of the report's contents along with the
+    parser version and options, so any change to the report (or to how it
+    is parsed) is a miss. Each entry is a compact binary snapshot: the field
+    names once, followed by a tuple of values per record.
+    """
+
+    def __init__(self, cache_dir,
+                 max_bytes=DEFAULT_REPORT_CACHE_MAX_BYTES,
+                 max_age_s=DEFAULT_REPORT_CACHE_MAX_AGE_S):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(content, *parser_options):
+        h = hashlib.sha256(content.encode('utf-8'))
+        h.update(repr(parser_options).encode('utf-8'))
+        return h.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + REPORT_SNAPSHOT_SUFFIX)
+
+    def load(self, key):
+        """Returns the list of field dicts for key, or None on a miss."""
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                names, values = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        # Keep recently used snapshots from being evicted.
+        os.utime(path)
+        self.hits += 1
+        return [dict(zip(names, v)) for v in values]
+
+    def store(self, key, records):
+        names = tuple(records[0].keys()) if records else ()
+        values = [tuple(r[n] for n in names) for r in records]
+        path = self.get_path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((names, values), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Removes snapshots that are too old, then the least recently used
+        ones until the cache fits in max_bytes."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(REPORT_SNAPSHOT_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            if now - stat.st_mtime > self.max_age_s:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+class LruMemo:
+    """A persistent memo of picklable keys to values.
+
+    The whole memo is loaded from a single pickle file up front and written
+    back by save(), if entries were added since. Beyond max_entries, the
+    least recently used entries are dropped. Lookups alone only make save()
+    rewrite the file once the memo is MEMO_SAVE_ORDER_FULLNESS full, so the
+    order is kept across runs by the time eviction starts, without writing
+    a mostly empty memo back on every run. With no path, nothing is
+    persisted.
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MEMO_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.reordered = False
+        if path:
+            try:
+                with open(path, 'rb') as f:
+                    self.entries = pickle.load(f)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                pass
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        self.reordered = True
+        return self.entries[key]
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        if not self.path:
+            return
+        if not self.dirty and not (
+                self.reordered and len(self.entries) >=
+                self.max_entries * MEMO_SAVE_ORDER_FULLNESS):
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        self.reordered = False
@@ -0,0 +1,163 @@
+from datetime import date
+import os
+import tempfile
+import time
+import unittest
+
+import amazon
+import cache
+from mockdata import csv_file, item_dict
+
+
+class ReportCacheClass(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_key(self):
+        key = cache.ReportCache.get_key('a,b\n1,2\n', 1, 'Item')
+        self.assertEqual(
+            key, cache.ReportCache.get_key('a,b\n1,2\n', 1, 'Item'))
+        self.assertNotEqual(
+            key, cache.ReportCache.get_key('a,b\n1,3\n', 1, 'Item'))
+        self.assertNotEqual(
+            key, cache.ReportCache.get_key('a,b\n1,2\n', 2, 'Item'))
+        self.assertNotEqual(
+            key, cache.ReportCache.get_key('a,b\n1,2\n', 1, 'Order'))
+
+    def test_load_and_store(self):
+        c = cache.ReportCache(self.cache_dir)
+        records = [
+            {'order_id': 'A', 'quantity': 2, 'order_date': date(2014, 2, 3)},
+            {'order_id': 'B', 'quantity': 1, 'order_date': None},
+        ]
+
+        self.assertEqual(c.load('abc'), None)
+        c.store('abc', records)
+        self.assertEqual(c.load('abc'), records)
+        self.assertEqual(c.hits, 1)
+        self.assertEqual(c.misses, 1)
+
+        c.store('empty', [])
+        self.assertEqual(c.load('empty'), [])
+
+    def test_evict_by_age(self):
+        c = cache.ReportCache(self.cache_dir, max_age_s=60)
+        c.store('old', [{'a': 1}])
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(c.get_path('old'), (an_hour_ago, an_hour_ago))
+        c.store('new', [{'a': 2}])
+
+        self.assertEqual(c.load('old'), None)
+        self.assertEqual(c.load('new'), [{'a': 2}])
+
+    def test_evict_by_size(self):
+        c = cache.ReportCache(self.cache_dir)
+        c.store('first', [{'a': 'x' * 1000}])
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(c.get_path('first'), (an_hour_ago, an_hour_ago))
+        c.max_bytes = 1500
+        c.store('second', [{'a': 'y' * 1000}])
+
+        self.assertEqual(c.load('first'), None)
+        self.assertEqual(c.load('second'), [{'a': 'y' * 1000}])
+
+    def test_parse_from_csv_uses_cache(self):
+        c = cache.ReportCache(self.cache_dir)
+        report = [item_dict(title='One'), item_dict(title='Two')]
+
+        items = amazon.Item.parse_from_csv(csv_file(report), cache=c)
+        self.assertEqual(c.misses, 1)
+        self.assertEqual([i.title for i in items], ['One', 'Two'])
+
+        items = amazon.Item.parse_from_csv(csv_file(report), cache=c)
+        self.assertEqual(c.hits, 1)
+        self.assertEqual([i.title for i in items], ['One', 'Two'])
+        self.assertEqual(items[0].item_total, 11950000)
+        self.assertEqual(items[0].shipment_date, date(2014, 2, 28))
+
+        amazon.Item.parse_from_csv(csv_file(report), all_fields=True, cache=c)
+        self.assertEqual(c.misses, 2)
+
+
+class LruMemoClass(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'memo.pickle')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_and_set(self):
+        memo = cache.LruMemo()
+        self.assertEqual(memo.get('a', 'default'), 'default')
+        memo['a'] = None
+        self.assertTrue('a' in memo)
+        self.assertEqual(memo.get('a', 'default'), None)
+        self.assertEqual(memo.hits, 1)
+        self.assertEqual(memo.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        memo = cache.LruMemo(max_entries=2)
+        memo['a'] = 1
+        memo['b'] = 2
+        memo.get('a')
+        memo['c'] = 3
+
+        self.assertEqual(len(memo), 2)
+        self.assertTrue('a' in memo)
+        self.assertFalse('b' in memo)
+        self.assertTrue('c' in memo)
+
+    def test_save_and_load(self):
+        memo = cache.LruMemo(self.path)
+        memo[((1, 2), (3,))] = [0, 0]
+        memo.save()
+
+        memo = cache.LruMemo(self.path)
+        self.assertEqual(memo.get(((1, 2), (3,))), [0, 0])
+
+    def test_save_only_when_changed(self):
+        memo = cache.LruMemo(self.path)
+        memo['a'] = 1
+        memo.save()
+        os.remove(self.path)
+
+        memo.get('a')
+        memo.get('b')
+        memo.save()
+        self.assertFalse(os.path.exists(self.path))
+
+        memo['b'] = 2
+        memo.save()
+        self.assertEqual(len(cache.LruMemo(self.path)), 2)
+
+    def test_keeps_recently_used_across_runs(self):
+        memo = cache.LruMemo(self.path, max_entries=3)
+        memo['a'] = 1
+        memo['b'] = 2
+        memo['c'] = 3
+        memo.save()
+
+        # A run that only looks 'a' up.
+        memo = cache.LruMemo(self.path, max_entries=3)
+        memo.get('a')
+        memo.save()
+
+        memo = cache.LruMemo(self.path, max_entries=3)
+        memo['d'] = 4
+        self.assertTrue('a' in memo)
+        self.assertFalse('b' in memo)
+
+    def test_load_missing_or_corrupt(self):
+        self.assertEqual(len(cache.LruMemo(self.path)), 0)
+        with open(self.path, 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertEqual(len(cache.LruMemo(self.path)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,7 +29,50 @@ def micro_usd_to_usd_string(micro_usd):
 
 
 def parse_usd_as_micro_usd(amount):
-    return int(round_usd(parse_usd_as_float(amount)) * 1000000)
+    """Parses a "-$1,234.56" style string into micro dollars (an int).
+
+    Only integer math is used, so there's no float rounding error. Like
+    parse_usd_as_float, empty or unparsable amounts are 0. The result is
+    rounded to the cent the same way round_usd does.
+    """
+    if not amount:
+        return 0
+    # Remove any formatting/grouping commas.
+    amount = amount.strip().replace(',', '')
+    negate = amount[:1] == '-'
+    if negate:
+        amount = amount[1:]
+    if amount[:1] == '$':
+        amount = amount[1:]
+    dollars, _, fraction = amount.partition('.')
+    if (not (dollars or fraction) or
+            (dollars and not dollars.isdigit()) or
+            (fraction and not fraction.isdigit())):
+        # Something exotic (exponents, etc); let float parsing sort it out.
+        return int(round_usd(parse_usd_as_float(amount)) * 1000000) * (
+            -1 if negate else 1)
+    micro_usd = (
+        int(dollars or 0) * 1000000 + int(fraction[:6].ljust(6, '0')))
+    if negate:
+        micro_usd = -micro_usd
+    # Round to the nearest cent, biased by DOLLAR_EPS like round_usd.
+    return (micro_usd + 5100) // CENT_MICRO_USD * CENT_MICRO_USD
+
+
+def parse_usd_list_as_micro_usd(amounts):
+    """Parses a whole column of amounts into micro dollars in one call.
+
+    Amounts repeat a lot (e.g. "$0.00"), so each distinct string is only
+    parsed once.
+    """
+    parsed = {}
+    result = []
+    for amount in amounts:
+        micro_usd = parsed.get(amount)
+        if micro_usd is None:
+            micro_usd = parsed[amount] = parse_usd_as_micro_usd(amount)
+        result.append(micro_usd)
+    return result
 
 
 def parse_usd_as_float(amount):
@@ -50,6 +50,31 @@ class CurrencyMethods(unittest.TestCase):
         self.assertEqual(currency.parse_usd_as_micro_usd('$12.23'), 12230000)
         self.assertEqual(currency.parse_usd_as_micro_usd('-$12.23'), -12230000)
 
+        self.assertEqual(currency.parse_usd_as_micro_usd(''), 0)
+        self.assertEqual(currency.parse_usd_as_micro_usd(None), 0)
+        self.assertEqual(currency.parse_usd_as_micro_usd('$'), 0)
+        self.assertEqual(currency.parse_usd_as_micro_usd('abc'), 0)
+        self.assertEqual(currency.parse_usd_as_micro_usd('$.5'), 500000)
+        self.assertEqual(currency.parse_usd_as_micro_usd('$1.5'), 1500000)
+        self.assertEqual(
+            currency.parse_usd_as_micro_usd('-$1,234.56'), -1234560000)
+        self.assertEqual(
+            currency.parse_usd_as_micro_usd('$9,999,999.99'), 9999999990000)
+        # Rounds to the nearest cent.
+        self.assertEqual(currency.parse_usd_as_micro_usd('$1.005'), 1010000)
+        self.assertEqual(currency.parse_usd_as_micro_usd('$1.0048'), 1000000)
+        self.assertEqual(currency.parse_usd_as_micro_usd('-$1.005'), -1000000)
+        # Float based parsing is off by a micro dollar on these.
+        self.assertEqual(currency.parse_usd_as_micro_usd('$2.01'), 2010000)
+        self.assertEqual(currency.parse_usd_as_micro_usd('$2.07'), 2070000)
+
+    def test_parse_usd_list_as_micro_usd(self):
+        self.assertEqual(currency.parse_usd_list_as_micro_usd([]), [])
+        self.assertEqual(
+            currency.parse_usd_list_as_micro_usd(
+                ['$1.23', '$0.00', '', '-$2.00', '$1.23']),
+            [1230000, 0, 0, -2000000, 1230000])
+
     def test_parse_usd_as_float(self):
         self.assertEqual(currency.parse_usd_as_float('$1.23'), 1.23)
         self.assertEqual(currency.parse_usd_as_float('$0.00'), 0)
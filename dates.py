@@ -0,0 +1,70 @@
+from datetime import date, datetime
+from functools import lru_cache
+
+# Dates repeat heavily: a decade of history only has a few thousand distinct
+# days, so a bounded cache catches nearly every lookup.
+DATE_CACHE_SIZE = 8192
+
+MONTH_ABBREVIATIONS = {
+    'Jan': 1,
+    'Feb': 2,
+    'Mar': 3,
+    'Apr': 4,
+    'May': 5,
+    'Jun': 6,
+    'Jul': 7,
+    'Aug': 8,
+    'Sep': 9,
+    'Oct': 10,
+    'Nov': 11,
+    'Dec': 12,
+}
+
+
+@lru_cache(maxsize=1)
+def current_year():
+    """The year used for Mint's year-less dates, computed once per run."""
+    return datetime.isocalendar(date.today())[0]
+
+
+def parse_two_digit_year(year):
+    # Same pivot as strptime's %y: 69-99 are 1900s, 00-68 are 2000s.
+    return year + (1900 if year >= 69 else 2000)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_slash_date(date_str):
+    """Parses m/d/Y or m/d/y into a datetime.date."""
+    parts = date_str.split('/')
+    if (len(parts) == 3 and all(p.isdigit() for p in parts) and
+            len(parts[0]) <= 2 and len(parts[1]) <= 2):
+        month, day, year = int(parts[0]), int(parts[1]), int(parts[2])
+        if len(parts[2]) == 4:
+            return date(year, month, day)
+        if len(parts[2]) == 2:
+            return date(parse_two_digit_year(year), month, day)
+    try:
+        return datetime.strptime(date_str, '%m/%d/%Y').date()
+    except ValueError:
+        return datetime.strptime(date_str, '%m/%d/%y').date()
+
+
+def parse_amazon_date(date_str):
+    if not date_str:
+        return None
+    return parse_slash_date(date_str)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_mint_date(date_str):
+    # Mint uses "Mon dd" for this year's transactions and m/d/y otherwise.
+    parts = date_str.split(' ')
+    if (len(parts) == 2 and parts[0] in MONTH_ABBREVIATIONS and
+            parts[1].isdigit()):
+        return date(
+            current_year(), MONTH_ABBREVIATIONS[parts[0]], int(parts[1]))
+    try:
+        return datetime.strptime(
+            date_str + str(current_year()), '%b %d%Y').date()
+    except ValueError:
+        return datetime.strptime(date_str, '%m/%d/%y').date()
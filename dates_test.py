@@ -0,0 +1,50 @@
+from datetime import date
+import unittest
+
+import dates
+
+
+class DatesMethods(unittest.TestCase):
+    def test_current_year(self):
+        self.assertEqual(dates.current_year(), date.today().isocalendar()[0])
+
+    def test_parse_slash_date(self):
+        self.assertEqual(dates.parse_slash_date('10/8/10'), date(2010, 10, 8))
+        self.assertEqual(dates.parse_slash_date('6/1/01'), date(2001, 6, 1))
+        self.assertEqual(dates.parse_slash_date('6/1/69'), date(1969, 6, 1))
+        self.assertEqual(dates.parse_slash_date('6/1/68'), date(2068, 6, 1))
+        self.assertEqual(
+            dates.parse_slash_date('07/21/2010'), date(2010, 7, 21))
+        self.assertEqual(
+            dates.parse_slash_date('1/23/1989'), date(1989, 1, 23))
+
+        with self.assertRaises(ValueError):
+            dates.parse_slash_date('13/1/10')
+        with self.assertRaises(ValueError):
+            dates.parse_slash_date('2/30/2010')
+        with self.assertRaises(ValueError):
+            dates.parse_slash_date('not a date')
+
+    def test_parse_amazon_date(self):
+        self.assertEqual(dates.parse_amazon_date(''), None)
+        self.assertEqual(dates.parse_amazon_date(None), None)
+        self.assertEqual(dates.parse_amazon_date('2/28/14'), date(2014, 2, 28))
+
+    def test_parse_mint_date(self):
+        year = dates.current_year()
+        self.assertEqual(dates.parse_mint_date('Jan 10'), date(year, 1, 10))
+        self.assertEqual(dates.parse_mint_date('Oct 08'), date(year, 10, 8))
+        self.assertEqual(dates.parse_mint_date('1/23/10'), date(2010, 1, 23))
+
+        with self.assertRaises(ValueError):
+            dates.parse_mint_date('Foo 10')
+
+    def test_parse_is_memoized(self):
+        dates.parse_slash_date.cache_clear()
+        first = dates.parse_slash_date('3/4/15')
+        self.assertTrue(dates.parse_slash_date('3/4/15') is first)
+        self.assertEqual(dates.parse_slash_date.cache_info().hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,598 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+import heapq
+
+from currency import micro_usd_nearly_equal
+from currency import CENT_MICRO_USD, MICRO_USD_EPS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Only consider it a match if the posted date (transaction date) is within
+# this many days of the ship date of the order.
+MAX_MATCH_DAYS = 3
+
+# Transact dates (as ordinals) take up the low bits of the keys the NumPy
+# engine sorts by, below the amount.
+DATE_KEY_BITS = 20
+
+# Connected components with more transactions than this (a popular price,
+# charged every few days for years) are matched greedily by the optimal
+# engine, so that no single min cost matching gets large.
+DEFAULT_OPTIMAL_MAX_COMPONENT = 200
+
+# At most this many orders are considered to have been charged together
+# across order ids.
+DEFAULT_CONSOLIDATED_MAX_ORDERS = 4
+
+
+def get_group_date(group):
+    """The transact date of the first order (or refund) in group that has
+    one, or None."""
+    return next(
+        (o.transact_date() for o in group if o.transact_date()), None)
+
+
+def get_amount_bucket(amount):
+    """Amounts within MICRO_USD_EPS of each other are in the same or
+    neighbouring buckets."""
+    return amount // MICRO_USD_EPS
+
+
+class MatchIndex:
+    """Candidate groups of orders (or refunds) to match transactions with.
+
+    Groups are indexed by amount bucket, and within a bucket sorted by
+    transact date, so the groups near a transaction's amount and date are
+    found by looking in three buckets and bisecting, rather than by scanning
+    every group. Amounts are compared with micro_usd_nearly_equal, so
+    rounding differences of a few micro dollars don't stop a match.
+    Matched groups are removed from the index.
+    """
+
+    def __init__(self, amounts_and_groups):
+        entries_by_bucket = defaultdict(list)
+        for seq, (amount, group) in enumerate(amounts_and_groups):
+            date = get_group_date(group)
+            # Groups without any date can never be matched.
+            if date:
+                entries_by_bucket[get_amount_bucket(amount)].append(
+                    (date, seq, group, amount))
+        self.dates = {}
+        self.entries = {}
+        for bucket, entries in entries_by_bucket.items():
+            entries.sort(key=lambda e: e[:2])
+            self.dates[bucket] = [e[0] for e in entries]
+            self.entries[bucket] = entries
+
+    def __len__(self):
+        return sum(len(e) for e in self.entries.values())
+
+    def remove(self, bucket, idx):
+        del self.dates[bucket][idx]
+        del self.entries[bucket][idx]
+
+    def pop_best(self, amount, date):
+        """Removes and returns the group of (nearly) amount closest to date.
+
+        Only groups within MAX_MATCH_DAYS of date, and without any order
+        already matched, are considered. Ties go to the group added first.
+        Returns None if there are none.
+        """
+        window = timedelta(days=MAX_MATCH_DAYS)
+        bucket = get_amount_bucket(amount)
+        best = None
+        best_key = None
+        stale = []
+        for b in (bucket - 1, bucket, bucket + 1):
+            dates = self.dates.get(b)
+            if not dates:
+                continue
+            lo = bisect_left(dates, date - window)
+            hi = bisect_right(dates, date + window)
+            entries = self.entries[b]
+            for idx in range(lo, hi):
+                group_date, seq, group, group_amount = entries[idx]
+                if not micro_usd_nearly_equal(amount, group_amount):
+                    continue
+                # Orders can be in several groups, so another group may have
+                # matched one already.
+                if any(o.matched for o in group):
+                    stale.append((b, idx))
+                    continue
+                key = (abs((date - group_date).days), seq)
+                if best_key is None or key < best_key:
+                    best = (b, idx)
+                    best_key = key
+
+        if best is not None:
+            stale.append(best)
+            best = self.entries[best[0]][best[1]][2]
+        for b, idx in sorted(stale, reverse=True):
+            self.remove(b, idx)
+        return best
+
+
+def match_amounts_numpy(trans, orders):
+    """Matches each transaction in turn with an order (or refund) of
+    (nearly) the same amount, exactly as MatchIndex.pop_best would, using
+    NumPy.
+
+    The orders are sorted by amount bucket and transact date packed into
+    one int64 key, so a searchsorted finds where every transaction's
+    candidates for each bucket and day of its window start at once. Only
+    picking amongst them, which depends on earlier matches, is done one
+    transaction at a time: trying the closest days first, and skipping over
+    matched orders.
+
+    Returns the matched order (or None) for each transaction. Nothing is
+    marked as matched.
+    """
+    matches = [None] * len(trans)
+    dated = [o for o in orders if o.transact_date()]
+    if not trans or not dated:
+        return matches
+
+    amounts = np.fromiter(
+        (o.transact_amount() for o in dated), np.int64, len(dated))
+    dates = np.fromiter(
+        (o.transact_date().toordinal() for o in dated), np.int64, len(dated))
+    keys = ((amounts // MICRO_USD_EPS) << DATE_KEY_BITS) + dates
+    # A stable sort keeps orders given first, first amongst equal keys.
+    order_idxs = np.argsort(keys, kind='stable')
+    keys = keys[order_idxs]
+
+    trans_amounts = np.fromiter(
+        (t.amount for t in trans), np.int64, len(trans))
+    trans_keys = (
+        ((trans_amounts // MICRO_USD_EPS) << DATE_KEY_BITS) +
+        np.fromiter(
+            (t.odate.toordinal() for t in trans), np.int64, len(trans)))
+    # day_starts[t, b, MAX_MATCH_DAYS + d] is where the candidates in bucket
+    # b (of the buckets before, at and after transaction t's amount) d days
+    # from t start, and those d - 1 days from it end.
+    days = np.arange(-MAX_MATCH_DAYS, MAX_MATCH_DAYS + 2)
+    buckets = np.array([-1, 0, 1]) << DATE_KEY_BITS
+    day_starts = np.searchsorted(
+        keys,
+        (trans_keys[:, np.newaxis, np.newaxis] +
+         buckets[np.newaxis, :, np.newaxis] +
+         days[np.newaxis, np.newaxis, :]),
+        'left')
+    with_candidates = np.flatnonzero(
+        (day_starts[:, :, 0] < day_starts[:, :, -1]).any(axis=1))
+
+    order_idxs = order_idxs.tolist()
+    sorted_amounts = amounts[order_idxs].tolist()
+    trans_amounts = trans_amounts.tolist()
+    # The first unmatched position at or after each position, with path
+    # compression.
+    next_unmatched = list(range(len(dated) + 1))
+    for pos, idx in enumerate(order_idxs):
+        if dated[idx].matched:
+            next_unmatched[pos] = pos + 1
+
+    def find_unmatched(pos):
+        root = pos
+        while next_unmatched[root] != root:
+            root = next_unmatched[root]
+        while next_unmatched[pos] != root:
+            next_unmatched[pos], pos = root, next_unmatched[pos]
+        return root
+
+    for t_idx in with_candidates.tolist():
+        amount = trans_amounts[t_idx]
+        bucket_starts = day_starts[t_idx].tolist()
+        for num_days in range(MAX_MATCH_DAYS + 1):
+            best_pos = None
+            for starts in bucket_starts:
+                for d in {-num_days, num_days}:
+                    start = starts[MAX_MATCH_DAYS + d]
+                    end = starts[MAX_MATCH_DAYS + d + 1]
+                    if start == end:
+                        continue
+                    # Amongst the same bucket and day, the first unmatched
+                    # position of a near enough amount is the order given
+                    # first.
+                    pos = find_unmatched(start)
+                    while pos < end and not micro_usd_nearly_equal(
+                            amount, sorted_amounts[pos]):
+                        pos = find_unmatched(pos + 1)
+                    if pos < end and (best_pos is None or
+                                      order_idxs[pos] < order_idxs[best_pos]):
+                        best_pos = pos
+            if best_pos is not None:
+                next_unmatched[best_pos] = best_pos + 1
+                matches[t_idx] = dated[order_idxs[best_pos]]
+                break
+    return matches
+
+
+def get_candidate_costs(trans, orders):
+    """Returns, for each transaction, a dict from the index of every
+    unmatched order (or refund) of (nearly) the same amount within
+    MAX_MATCH_DAYS of it to how many days apart they are."""
+    window = timedelta(days=MAX_MATCH_DAYS)
+    entries_by_bucket = defaultdict(list)
+    for idx, o in enumerate(orders):
+        if o.transact_date() and not o.matched:
+            entries_by_bucket[get_amount_bucket(o.transact_amount())].append(
+                (o.transact_date(), idx))
+    dates_by_bucket = {}
+    for bucket, entries in entries_by_bucket.items():
+        entries.sort()
+        dates_by_bucket[bucket] = [d for d, _ in entries]
+
+    costs = []
+    for t in trans:
+        bucket = get_amount_bucket(t.amount)
+        t_costs = {}
+        for b in (bucket - 1, bucket, bucket + 1):
+            dates = dates_by_bucket.get(b)
+            if not dates:
+                continue
+            lo = bisect_left(dates, t.odate - window)
+            hi = bisect_right(dates, t.odate + window)
+            for order_date, idx in entries_by_bucket[b][lo:hi]:
+                if micro_usd_nearly_equal(
+                        t.amount, orders[idx].transact_amount()):
+                    t_costs[idx] = abs((t.odate - order_date).days)
+        costs.append(t_costs)
+    return costs
+
+
+def min_cost_matching(costs):
+    """Matches as many left nodes with right nodes as possible, at the least
+    total cost.
+
+    costs holds a dict per left node from each right node it may be matched
+    with to the (non-negative) cost of doing so. Returns the matched right
+    node (or None) for each left node.
+
+    This is the primal-dual method: in phases, Dijkstra finds how far the
+    cheapest way to match one more left node (possibly rematching others)
+    is, with node potentials keeping the reduced costs non-negative. Then
+    as many disjoint ways as possible that cheap are taken at once, until
+    no more left nodes can be matched.
+    """
+    num_left = len(costs)
+    match_left = [None] * num_left
+    match_right = {}
+    # Left node i is node i, and right node j is node num_left + j.
+    potential = defaultdict(int)
+
+    def reduced_cost(i, j):
+        return costs[i][j] + potential[i] - potential[num_left + j]
+
+    def augment(source, visited):
+        """Matches source along a path of zero reduced cost edges, through
+        nodes not yet visited. Returns whether there was one."""
+        # The left nodes along the path, and the right nodes between them.
+        lefts = [source]
+        rights = []
+        edges = [iter(costs[source])]
+        while lefts:
+            i = lefts[-1]
+            for j in edges[-1]:
+                if (num_left + j in visited or match_left[i] == j or
+                        reduced_cost(i, j) != 0):
+                    continue
+                visited.add(num_left + j)
+                rights.append(j)
+                if j not in match_right:
+                    for i, j in zip(lefts, rights):
+                        match_left[i] = j
+                        match_right[j] = i
+                    return True
+                lefts.append(match_right[j])
+                edges.append(iter(costs[match_right[j]]))
+                break
+            else:
+                lefts.pop()
+                edges.pop()
+                if rights:
+                    rights.pop()
+        return False
+
+    while True:
+        sources = [i for i in range(num_left) if match_left[i] is None]
+        dist = {}
+        heap = [(0, i) for i in sources]
+        best = {i: 0 for i in sources}
+        end_dist = None
+        while heap:
+            d, node = heapq.heappop(heap)
+            if node in dist:
+                continue
+            if end_dist is not None and d > end_dist:
+                break
+            dist[node] = d
+            if node >= num_left:
+                j = node - num_left
+                if j not in match_right:
+                    end_dist = d if end_dist is None else end_dist
+                    continue
+                # Follow the matched edge back, which has no reduced cost.
+                edges = [(match_right[j], 0)]
+            else:
+                edges = [(num_left + j, reduced_cost(node, j))
+                         for j in costs[node] if match_left[node] != j]
+            for next_node, cost in edges:
+                nd = d + cost
+                if next_node not in dist and (
+                        next_node not in best or nd < best[next_node]):
+                    best[next_node] = nd
+                    heapq.heappush(heap, (nd, next_node))
+        if end_dist is None:
+            return match_left
+
+        # Nodes the search didn't settle are at least end_dist away, so
+        # lowering the settled ones by how much nearer they are keeps
+        # reduced costs non-negative, and makes those of the cheapest ways
+        # zero.
+        for node, d in dist.items():
+            potential[node] += d - end_dist
+        visited = set()
+        for i in sources:
+            augment(i, visited)
+
+
+def split_where(entries, is_gap):
+    """Splits a list into runs, between each two neighbours a and b where
+    is_gap(a, b)."""
+    runs = []
+    for entry in entries:
+        if not runs or is_gap(runs[-1][-1], entry):
+            runs.append([])
+        runs[-1].append(entry)
+    return runs
+
+
+def get_match_components(trans, orders):
+    """Returns (transaction indexes, order indexes) for each group of
+    transactions and unmatched orders (or refunds) that could only be
+    matched amongst themselves.
+
+    Amounts are split wherever sorted neighbours are MICRO_USD_EPS or more
+    apart, and then dates wherever sorted neighbours are more than
+    MAX_MATCH_DAYS apart. No transaction has a candidate across a split,
+    and finding them takes a couple of sorts rather than every candidate.
+    """
+    nodes = [(t.amount, t.odate, False, idx) for idx, t in enumerate(trans)]
+    nodes.extend(
+        (o.transact_amount(), o.transact_date(), True, idx)
+        for idx, o in enumerate(orders)
+        if o.transact_date() and not o.matched)
+    nodes.sort(key=lambda n: n[0])
+    components = []
+    for amount_run in split_where(
+            nodes, lambda a, b: b[0] - a[0] >= MICRO_USD_EPS):
+        amount_run.sort(key=lambda n: n[1])
+        for run in split_where(
+                amount_run, lambda a, b: (b[1] - a[1]).days > MAX_MATCH_DAYS):
+            t_idxs = sorted(idx for _, _, is_order, idx in run if not is_order)
+            o_idxs = sorted(idx for _, _, is_order, idx in run if is_order)
+            if t_idxs and o_idxs:
+                components.append((t_idxs, o_idxs))
+    return components
+
+
+def match_amounts_optimal(trans, orders,
+                          max_component=DEFAULT_OPTIMAL_MAX_COMPONENT):
+    """Matches transactions with orders (or refunds) of (nearly) the same
+    amount as MatchIndex.pop_best would, except all at once: as many
+    transactions as possible are matched, and then as close in date as
+    possible, however they were ordered.
+
+    The transactions and orders are split into get_match_components, and
+    those of up to max_component transactions (usually one amount, over a
+    few days) are solved with min_cost_matching. Larger ones are matched
+    one transaction at a time with a MatchIndex, like the greedy engine,
+    so the whole stays near linear.
+
+    Returns the matched order (or None) for each transaction. Nothing is
+    marked as matched.
+    """
+    matches = [None] * len(trans)
+    greedy_trans = []
+    greedy_orders = []
+    for t_idxs, o_idxs in get_match_components(trans, orders):
+        if len(t_idxs) > max_component:
+            greedy_trans.extend(t_idxs)
+            greedy_orders.extend(o_idxs)
+            continue
+        costs = get_candidate_costs(
+            [trans[t_idx] for t_idx in t_idxs],
+            [orders[o_idx] for o_idx in o_idxs])
+        matched = min_cost_matching(costs)
+        for t_idx, o_pos in zip(t_idxs, matched):
+            if o_pos is not None:
+                matches[t_idx] = orders[o_idxs[o_pos]]
+
+    if greedy_trans:
+        # Every candidate of a transaction is in its component, so one index
+        # of the orders of all the large components will do.
+        index = MatchIndex(
+            (orders[o_idx].transact_amount(), [orders[o_idx]])
+            for o_idx in sorted(greedy_orders))
+        for t_idx in sorted(greedy_trans):
+            group = index.pop_best(trans[t_idx].amount, trans[t_idx].odate)
+            if group:
+                matches[t_idx] = group[0]
+    return matches
+
+
+def get_subset_sums(idxs, amounts):
+    """Returns a (subset, sum) for every subset of idxs, where subsets are
+    tuples of idxs (in order) and amounts maps an index to its amount."""
+    subset_sums = [((), 0)]
+    for idx in idxs:
+        subset_sums += [
+            (subset + (idx,), total + amounts[idx])
+            for subset, total in subset_sums]
+    return subset_sums
+
+
+class CombinedChargeIndex:
+    """Finds combinations of orders (or refunds) with the same order id that
+    were charged together, without materializing every combination.
+
+    For a transaction, only the order ids with an order near its date are
+    searched, each by meeting in the middle: the sums of every subset of
+    one half of the order id's unmatched orders are looked up against the
+    sums of the other half. The half sums are kept until another order of
+    that order id is matched.
+
+    The best combination is the same as the closest of all combinations of
+    two or more orders, ordered by order id and then as
+    itertools.combinations would list them.
+    """
+
+    def __init__(self, orders):
+        groups_by_oid = defaultdict(list)
+        for o in orders:
+            groups_by_oid[o.order_id].append(o)
+        self.groups = list(groups_by_oid.values())
+        dated = sorted(
+            (o.transact_date(), group_idx)
+            for group_idx, group in enumerate(self.groups)
+            for o in group if o.transact_date())
+        self.dates = [d for d, _ in dated]
+        self.group_idxs = [g for _, g in dated]
+        self.half_sums = {}
+
+    def get_half_sums(self, group_idx):
+        group = self.groups[group_idx]
+        idxs = tuple(i for i, o in enumerate(group) if not o.matched)
+        cached = self.half_sums.get(group_idx)
+        if cached and cached[0] == idxs:
+            return cached[1:]
+        amounts = [o.transact_amount() for o in group]
+        half = len(idxs) // 2
+        left = get_subset_sums(idxs[:half], amounts)
+        right = defaultdict(list)
+        for subset, total in get_subset_sums(idxs[half:], amounts):
+            right[total].append(subset)
+        self.half_sums[group_idx] = (idxs, left, right)
+        return left, right
+
+    def pop_best(self, amount, date):
+        """Returns the combination of orders adding up to amount closest to
+        date, or None.
+
+        A combination's date is that of its first order with one. Only
+        combinations within MAX_MATCH_DAYS of date, of unmatched orders,
+        are considered, so once matched a combination drops out.
+        """
+        window = timedelta(days=MAX_MATCH_DAYS)
+        lo = bisect_left(self.dates, date - window)
+        hi = bisect_right(self.dates, date + window)
+        group_idxs = sorted(set(self.group_idxs[lo:hi]))
+
+        best = None
+        best_key = None
+        for group_idx in group_idxs:
+            group = self.groups[group_idx]
+            left, right = self.get_half_sums(group_idx)
+            for left_subset, left_total in left:
+                for right_subset in right.get(amount - left_total, ()):
+                    subset = left_subset + right_subset
+                    if len(subset) < 2:
+                        continue
+                    combo = tuple(group[i] for i in subset)
+                    combo_date = get_group_date(combo)
+                    if not combo_date:
+                        continue
+                    num_days = abs((date - combo_date).days)
+                    if num_days > MAX_MATCH_DAYS:
+                        continue
+                    key = (num_days, group_idx, len(subset), subset)
+                    if best_key is None or key < best_key:
+                        best = combo
+                        best_key = key
+        return best
+
+
+def find_subset_with_sum(values, target, max_size):
+    """Returns the indices of 2 to max_size of values (non-negative ints)
+    that sum to target, or None.
+
+    Uses the fewest values possible, and then prefers leaving out values
+    later in the list. This is a subset sum over bitsets: one bitset of
+    the reachable sums per prefix of values and number of values used.
+    """
+    if target < 0 or max_size < 2:
+        return None
+    mask = (1 << (target + 1)) - 1
+    layers = [[1] + [0] * max_size]
+    for v in values:
+        prev = layers[-1]
+        layers.append([prev[0]] + [
+            (prev[k] | (prev[k - 1] << v)) & mask
+            for k in range(1, max_size + 1)])
+
+    for size in range(2, max_size + 1):
+        if not layers[-1][size] >> target & 1:
+            continue
+        subset = []
+        left = target
+        k = size
+        for i in range(len(values) - 1, -1, -1):
+            if k == 0:
+                break
+            # Take values[i] only if the rest can't be made without it.
+            if not layers[i][k] >> left & 1:
+                subset.append(i)
+                left -= values[i]
+                k -= 1
+        return subset[::-1]
+    return None
+
+
+class ConsolidatedChargeIndex:
+    """Finds combinations of orders (or refunds), across order ids, that
+    were charged as one.
+
+    Only unmatched orders within window_days of a transaction are
+    considered, and at most max_orders of them at a time, which keeps the
+    subset sum small. Closer orders are preferred.
+    """
+
+    def __init__(self, orders,
+                 max_orders=DEFAULT_CONSOLIDATED_MAX_ORDERS,
+                 window_days=MAX_MATCH_DAYS):
+        self.max_orders = max_orders
+        self.window = timedelta(days=window_days)
+        dated = sorted(
+            ((o.transact_date(), seq, o) for seq, o in enumerate(orders)
+             if o.transact_date()),
+            key=lambda d: d[:2])
+        self.dates = [d for d, _, _ in dated]
+        self.entries = dated
+
+    def pop_best(self, amount, date):
+        """Returns a combination of two or more orders adding up to amount,
+        or None. Once matched, its orders drop out."""
+        # Refunds have negative amounts; search on magnitudes in cents.
+        sign = -1 if amount < 0 else 1
+        if amount == 0 or amount % CENT_MICRO_USD:
+            return None
+        lo = bisect_left(self.dates, date - self.window)
+        hi = bisect_right(self.dates, date + self.window)
+        candidates = sorted(
+            (abs((date - d).days), seq, o)
+            for d, seq, o in self.entries[lo:hi]
+            if not o.matched and
+            sign * o.transact_amount() > 0 and
+            o.transact_amount() % CENT_MICRO_USD == 0)
+        orders = [o for _, _, o in candidates]
+        subset = find_subset_with_sum(
+            [sign * o.transact_amount() // CENT_MICRO_USD for o in orders],
+            sign * amount // CENT_MICRO_USD,
+            self.max_orders)
+        if subset is None:
+            return None
+        return tuple(orders[i] for i in subset)
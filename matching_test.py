@@ -0,0 +1,405 @@
+from datetime import date
+import itertools
+import random
+import unittest
+
+from currency import micro_usd_to_usd_string
+from matching import CombinedChargeIndex, ConsolidatedChargeIndex
+from matching import MatchIndex, find_subset_with_sum, get_match_components
+from matching import match_amounts_numpy, match_amounts_optimal
+from matching import min_cost_matching, np
+from mockdata import order, refund, transaction
+
+
+def make_index(orders):
+    return MatchIndex((o.transact_amount(), [o]) for o in orders)
+
+
+class MatchIndexClass(unittest.TestCase):
+    def test_pop_best_by_amount(self):
+        o1 = order(total_charged='$11.95')
+        o2 = order(total_charged='$5.00')
+        index = make_index([o1, o2])
+
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)), [o2])
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(1000000, date(2014, 2, 28)), None)
+        self.assertEqual(len(index), 1)
+
+    def test_pop_best_within_window(self):
+        o1 = order(shipment_date='02/20/14')
+        index = make_index([o1])
+
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 16)), None)
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 24)), None)
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 23)), [o1])
+
+    def test_pop_best_closest(self):
+        o1 = order(shipment_date='02/25/14')
+        o2 = order(shipment_date='02/27/14')
+        o3 = order(shipment_date='02/28/14')
+        o4 = order(shipment_date='03/01/14')
+        index = make_index([o1, o2, o3, o4])
+
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 28)), [o3])
+        # A tie goes to the first group given.
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 28)), [o2])
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 28)), [o4])
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 28)), [o1])
+        self.assertEqual(len(index), 0)
+
+    def test_skips_groups_already_matched(self):
+        o1 = order(shipment_date='02/27/14')
+        o2 = order(shipment_date='02/28/14')
+        index = MatchIndex([
+            (20000000, [o1, o2]),
+            (20000000, [o2]),
+            (20000000, [o1]),
+        ])
+        o2.matched = True
+
+        self.assertEqual(index.pop_best(20000000, date(2014, 2, 28)), [o1])
+        self.assertEqual(len(index), 0)
+
+    def test_pop_best_nearly_equal_amounts(self):
+        o1 = order()
+        o1.total_charged = 4999999
+        o2 = order()
+        o2.total_charged = 5000049
+        index = make_index([o1, o2])
+
+        self.assertEqual(index.pop_best(5000049, date(2014, 2, 28)), [o2])
+        self.assertEqual(index.pop_best(5000050, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(5000010, date(2014, 2, 28)), [o1])
+
+    def test_skips_groups_without_dates(self):
+        o1 = order(shipment_date='')
+        index = make_index([o1])
+
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.pop_best(11950000, date(2014, 2, 28)), None)
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class MatchAmountsNumpy(unittest.TestCase):
+    def test_match_amounts(self):
+        o1 = order(total_charged='$5.00', shipment_date='02/25/14')
+        o2 = order(total_charged='$5.00', shipment_date='02/27/14')
+        o3 = order(total_charged='$6.00', shipment_date='02/27/14')
+        o4 = order(total_charged='$5.00', shipment_date='')
+        t1 = transaction(amount='$5.00', date='2/28/14')
+        t2 = transaction(amount='$5.00', date='2/28/14')
+        t3 = transaction(amount='$5.00', date='2/28/14')
+        t4 = transaction(amount='$7.00', date='2/28/14')
+
+        self.assertEqual(
+            match_amounts_numpy([t1, t2, t3, t4], [o1, o2, o3, o4]),
+            [o2, o1, None, None])
+        self.assertEqual(match_amounts_numpy([], [o1]), [])
+        self.assertEqual(match_amounts_numpy([t1], []), [None])
+
+    def test_same_as_match_index(self):
+        rand = random.Random(5)
+        num_matches = 0
+        for _ in range(20):
+            orders = [
+                order(shipment_date='02/{:02d}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            # Off by a few micro dollars, some nearly equal and some not.
+            for o in orders:
+                o.total_charged = (
+                    rand.choice([-2, 3, 5]) * 1000000 + rand.randint(-60, 60))
+            trans = [
+                transaction(
+                    amount=micro_usd_to_usd_string(
+                        rand.choice([2, 3, 5]) * 1000000),
+                    is_debit=rand.random() < 0.7,
+                    date='2/{}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            initially_matched = [rand.random() < 0.1 for _ in orders]
+            for o, matched in zip(orders, initially_matched):
+                o.matched = matched
+            matches = match_amounts_numpy(trans, orders)
+
+            index = MatchIndex((o.transact_amount(), [o]) for o in orders)
+            for t, o in zip(trans, matches):
+                group = index.pop_best(t.amount, t.odate)
+                self.assertEqual(o, group[0] if group else None)
+                for matched_o in group or ():
+                    matched_o.matched = True
+            num_matches += len([m for m in matches if m])
+        self.assertGreater(num_matches, 0)
+
+
+class MinCostMatching(unittest.TestCase):
+    def test_min_cost_matching(self):
+        self.assertEqual(min_cost_matching([]), [])
+        self.assertEqual(min_cost_matching([{}]), [None])
+        self.assertEqual(
+            min_cost_matching([{0: 0, 1: 2}, {0: 1}]), [1, 0])
+        self.assertEqual(
+            min_cost_matching([{0: 1, 1: 0}, {0: 0, 1: 1}]), [1, 0])
+        self.assertEqual(
+            min_cost_matching([{0: 0}, {0: 1}, {0: 2}]), [0, None, None])
+
+    def test_same_as_every_matching(self):
+        rand = random.Random(1)
+        for _ in range(200):
+            num_right = rand.randint(0, 5)
+            costs = [
+                {j: rand.randint(0, 3) for j in range(num_right)
+                 if rand.random() < 0.5}
+                for _ in range(rand.randint(0, 5))
+            ]
+
+            def key(matched):
+                return (
+                    -len([j for j in matched if j is not None]),
+                    sum(costs[i][j] for i, j in enumerate(matched)
+                        if j is not None))
+
+            best = min(
+                (matched for matched in itertools.product(
+                    *[[None] + list(c) for c in costs])
+                 if len(set(j for j in matched if j is not None)) ==
+                 len([j for j in matched if j is not None])),
+                key=key)
+            self.assertEqual(key(min_cost_matching(costs)), key(best))
+
+
+class MatchAmountsOptimal(unittest.TestCase):
+    def test_matches_more_than_one_at_a_time(self):
+        o1 = order(total_charged='$5.00', shipment_date='02/25/14')
+        o2 = order(total_charged='$5.00', shipment_date='02/28/14')
+        t1 = transaction(amount='$5.00', date='2/28/14')
+        t2 = transaction(amount='$5.00', date='3/2/14')
+
+        # One at a time, t1 takes o2, leaving nothing close enough for t2.
+        index = make_index([o1, o2])
+        self.assertEqual(index.pop_best(t1.amount, t1.odate), [o2])
+        self.assertEqual(index.pop_best(t2.amount, t2.odate), None)
+
+        self.assertEqual(match_amounts_optimal([t1, t2], [o1, o2]), [o1, o2])
+
+    def test_match_amounts(self):
+        o1 = order(total_charged='$5.00', shipment_date='02/25/14')
+        o2 = order(total_charged='$5.00', shipment_date='02/27/14')
+        o3 = order(total_charged='$6.00', shipment_date='02/27/14')
+        o4 = order(total_charged='$5.00', shipment_date='')
+        o5 = order(total_charged='$7.00', shipment_date='02/27/14')
+        o5.matched = True
+        t1 = transaction(amount='$5.00', date='2/28/14')
+        t2 = transaction(amount='$5.00', date='2/28/14')
+        t3 = transaction(amount='$5.00', date='2/28/14')
+        t4 = transaction(amount='$7.00', date='2/28/14')
+
+        matches = match_amounts_optimal([t1, t2, t3, t4], [o1, o2, o3, o4, o5])
+        self.assertEqual(sorted(matches[:3], key=id),
+                         sorted([o1, o2, None], key=id))
+        self.assertEqual(matches[3], None)
+        self.assertEqual(match_amounts_optimal([], [o1]), [])
+        self.assertEqual(match_amounts_optimal([t1], []), [None])
+
+    def test_matches_at_least_as_many_as_match_index(self):
+        rand = random.Random(5)
+        for _ in range(20):
+            orders = [
+                order(shipment_date='02/{:02d}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            for o in orders:
+                o.total_charged = (
+                    rand.choice([-2, 3, 5]) * 1000000 + rand.randint(-60, 60))
+            trans = [
+                transaction(
+                    amount=micro_usd_to_usd_string(
+                        rand.choice([2, 3, 5]) * 1000000),
+                    is_debit=rand.random() < 0.7,
+                    date='2/{}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            matches = match_amounts_optimal(trans, orders)
+            matched = [o for o in matches if o]
+            self.assertEqual(len(set(map(id, matched))), len(matched))
+            for t, o in zip(trans, matches):
+                if o:
+                    self.assertLess(abs(t.amount - o.transact_amount()), 50)
+                    self.assertLessEqual(
+                        abs((t.odate - o.transact_date()).days), 3)
+
+            index = MatchIndex((o.transact_amount(), [o]) for o in orders)
+            num_greedy = 0
+            for t in trans:
+                group = index.pop_best(t.amount, t.odate)
+                if group:
+                    group[0].matched = True
+                    num_greedy += 1
+            self.assertGreaterEqual(len(matched), num_greedy)
+
+    def test_get_match_components(self):
+        o1 = order(total_charged='$5.00', shipment_date='02/01/14')
+        o2 = order(total_charged='$5.00', shipment_date='02/03/14')
+        o3 = order(total_charged='$5.00', shipment_date='02/10/14')
+        o4 = order(total_charged='$6.00', shipment_date='02/10/14')
+        o5 = order(total_charged='$5.00', shipment_date='02/11/14')
+        o5.matched = True
+        t1 = transaction(amount='$5.00', date='2/11/14')
+        t2 = transaction(amount='$5.00', date='2/5/14')
+        t3 = transaction(amount='$7.00', date='2/10/14')
+
+        self.assertEqual(
+            get_match_components([t1, t2, t3], [o1, o2, o3, o4, o5]),
+            [([1], [0, 1]), ([0], [2])])
+
+    def test_large_components_match_greedily(self):
+        rand = random.Random(7)
+        for _ in range(20):
+            orders = [
+                order(shipment_date='02/{:02d}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            for o in orders:
+                o.total_charged = (
+                    rand.choice([-2, 3, 5]) * 1000000 + rand.randint(-60, 60))
+            trans = [
+                transaction(
+                    amount=micro_usd_to_usd_string(
+                        rand.choice([2, 3, 5]) * 1000000),
+                    is_debit=rand.random() < 0.7,
+                    date='2/{}/14'.format(rand.randint(1, 20)))
+                for _ in range(rand.randint(1, 40))
+            ]
+            matches = match_amounts_optimal(trans, orders, max_component=0)
+
+            index = make_index(orders)
+            for t, o in zip(trans, matches):
+                group = index.pop_best(t.amount, t.odate)
+                self.assertEqual(o, group[0] if group else None)
+
+
+class CombinedChargeIndexClass(unittest.TestCase):
+    def test_pop_best(self):
+        o1 = order(order_id='A', total_charged='$1.00')
+        o2 = order(order_id='A', total_charged='$2.00')
+        o3 = order(order_id='A', total_charged='$4.00')
+        o4 = order(order_id='B', total_charged='$3.00')
+        index = CombinedChargeIndex([o1, o2, o3, o4])
+
+        # Single orders and combinations across order ids don't count.
+        self.assertEqual(index.pop_best(4000000, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)), (o1, o3))
+        self.assertEqual(index.pop_best(7000000, date(2014, 2, 28)),
+                         (o1, o2, o3))
+        self.assertEqual(index.pop_best(5000000, date(2014, 3, 4)), None)
+
+        o1.matched = True
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(6000000, date(2014, 2, 28)), (o2, o3))
+
+    def test_same_as_every_combination(self):
+        rand = random.Random(3)
+        found = 0
+        for _ in range(50):
+            orders = [
+                order(order_id=rand.choice('ABC'),
+                      total_charged=micro_usd_to_usd_string(
+                          rand.randint(1, 6) * 1000000),
+                      shipment_date='02/{:02d}/14'.format(rand.randint(1, 9)))
+                for _ in range(rand.randint(2, 12))
+            ]
+            queries = [
+                (rand.randint(2, 15) * 1000000,
+                 date(2014, 2, rand.randint(1, 9)))
+                for _ in range(5)
+            ]
+
+            # How combined charges used to be matched.
+            amounts_and_combos = []
+            for oid in sorted(set(o.order_id for o in orders),
+                              key=[o.order_id for o in orders].index):
+                orders_same_id = [o for o in orders if o.order_id == oid]
+                for r in range(2, len(orders_same_id) + 1):
+                    for c in itertools.combinations(orders_same_id, r):
+                        amounts_and_combos.append(
+                            (sum(o.transact_amount() for o in c), c))
+            expected_index = MatchIndex(amounts_and_combos)
+            expected = []
+            for amount, when in queries:
+                combo = expected_index.pop_best(amount, when)
+                expected.append(combo)
+                found += combo is not None
+                for o in combo or ():
+                    o.matched = True
+
+            for o in orders:
+                o.matched = False
+            index = CombinedChargeIndex(orders)
+            for (amount, when), expected_combo in zip(queries, expected):
+                combo = index.pop_best(amount, when)
+                self.assertEqual(combo, expected_combo)
+                for o in combo or ():
+                    o.matched = True
+        self.assertGreater(found, 0)
+
+
+class FindSubsetWithSum(unittest.TestCase):
+    def test_find_subset_with_sum(self):
+        self.assertEqual(find_subset_with_sum([1, 2, 4, 8], 12, 4), [2, 3])
+        self.assertEqual(find_subset_with_sum([1, 2, 4, 8], 7, 3), [0, 1, 2])
+        self.assertEqual(find_subset_with_sum([1, 2, 4, 8], 7, 2), None)
+        # A single value is never enough.
+        self.assertEqual(find_subset_with_sum([1, 2, 4, 8], 8, 4), None)
+        self.assertEqual(find_subset_with_sum([], 0, 4), None)
+
+    def test_prefers_fewest_then_earliest(self):
+        self.assertEqual(
+            find_subset_with_sum([1, 1, 1, 2, 1], 3, 4), [0, 3])
+        self.assertEqual(
+            find_subset_with_sum([3, 1, 1, 1], 3, 4), [1, 2, 3])
+        self.assertEqual(find_subset_with_sum([5, 5, 5], 10, 3), [0, 1])
+
+
+class ConsolidatedChargeIndexClass(unittest.TestCase):
+    def test_pop_best(self):
+        o1 = order(order_id='A', total_charged='$1.00',
+                   shipment_date='02/27/14')
+        o2 = order(order_id='B', total_charged='$2.00',
+                   shipment_date='02/28/14')
+        o3 = order(order_id='C', total_charged='$2.00',
+                   shipment_date='02/20/14')
+        index = ConsolidatedChargeIndex([o1, o2, o3])
+
+        self.assertEqual(index.pop_best(2000000, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(3000000, date(2014, 2, 28)), (o2, o1))
+        self.assertEqual(index.pop_best(4000000, date(2014, 2, 28)), None)
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 24)), None)
+
+        index = ConsolidatedChargeIndex([o1, o2, o3], window_days=10)
+        self.assertEqual(index.pop_best(4000000, date(2014, 2, 28)), (o2, o3))
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)),
+                         (o2, o1, o3))
+
+        index = ConsolidatedChargeIndex(
+            [o1, o2, o3], max_orders=2, window_days=10)
+        self.assertEqual(index.pop_best(5000000, date(2014, 2, 28)), None)
+
+        o1.matched = True
+        index = ConsolidatedChargeIndex([o1, o2, o3], window_days=10)
+        self.assertEqual(index.pop_best(3000000, date(2014, 2, 28)), None)
+
+    def test_refunds(self):
+        r1 = refund(order_id='A', refund_amount='$1.00',
+                    refund_tax_amount='$0.00', refund_date='3/12/14')
+        r2 = refund(order_id='B', refund_amount='$2.00',
+                    refund_tax_amount='$0.00', refund_date='3/12/14')
+        index = ConsolidatedChargeIndex([r1, r2])
+
+        self.assertEqual(index.pop_best(3000000, date(2014, 3, 12)), None)
+        self.assertEqual(index.pop_best(-3000000, date(2014, 3, 12)),
+                         (r1, r2))
+
+
+if __name__ == '__main__':
+    unittest.main()
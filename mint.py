@@ -1,12 +1,12 @@
 from collections import defaultdict
-from copy import deepcopy
-from datetime import date, datetime
+from copy import copy
 import re
 
 import category
 from currency import micro_usd_to_usd_string
 from currency import parse_usd_as_micro_usd
 from currency import round_micro_usd_to_cent
+from dates import parse_mint_date
 
 
 def truncate_title(title, target_length, base_str=None):
@@ -57,42 +57,91 @@ def pythonify_mint_dict(raw_dict):
     ])
 
 
-def parse_mint_date(date_str):
-    current_year = datetime.isocalendar(date.today())[0]
-    try:
-        new_date = datetime.strptime(date_str + str(current_year), '%b %d%Y')
-    except:
-        new_date = datetime.strptime(date_str, '%m/%d/%y')
-    return new_date.date()
+# The (pythonified) fields of a Mint transaction.
+TRANSACTION_FIELDS = (
+    'account',
+    'amount',
+    'category',
+    'category_id',
+    'date',
+    'fi',
+    'has_attachments',
+    'id',
+    'is_after_fi_creation_time',
+    'is_check',
+    'is_child',
+    'is_debit',
+    'is_duplicate',
+    'is_edited',
+    'is_first_date',
+    'is_linked_to_rule',
+    'is_matched',
+    'is_pending',
+    'is_percent',
+    'is_spending',
+    'is_transfer',
+    'labels',
+    'manual_type',
+    'mcategory',
+    'merchant',
+    'mmerchant',
+    'note',
+    'number_matched_by_rule',
+    'odate',
+    'omerchant',
+    'pid',
+    'rule_category',
+    'rule_category_id',
+    'rule_merchant',
+    'txn_type',
+    'user_category_id',
+)
 
 
 class Transaction(object):
     """A Mint tranaction."""
 
-    matched = False
-    orders = []
-    children = []
+    # Any fields Mint adds beyond TRANSACTION_FIELDS go into a __dict__, which
+    # is only allocated when needed.
+    __slots__ = TRANSACTION_FIELDS + (
+        'children', 'matched', 'orders', '__dict__')
 
     def __init__(self, raw_dict):
-        self.__dict__.update(pythonify_mint_dict(raw_dict))
+        self.matched = False
+        self.orders = []
+        self.children = []
+        for name, value in pythonify_mint_dict(raw_dict).items():
+            setattr(self, name, value)
+
+    def __setstate__(self, state):
+        # Slotted objects pickle as (__dict__, slots); pickles from before
+        # __slots__ are a plain dict.
+        dict_state, slot_state = (
+            state if isinstance(state, tuple) else (state, None))
+        if slot_state is None:
+            # These used to be class level defaults, so were never pickled.
+            self.matched = False
+            self.orders = []
+            self.children = []
+        for name, value in (dict_state or {}).items():
+            setattr(self, name, value)
+        for name, value in (slot_state or {}).items():
+            setattr(self, name, value)
 
     def split(self, amount, category, desc, note, is_debit=True):
-        """Returns a new Transaction split from self."""
-        item = deepcopy(self)
-
-        # Itemized should NOT have this info, otherwise there are some lovely
-        # cycles.
-        item.matched = False
-        item.orders = []
-        item.children = []
-
-        item.merchant = desc
-        item.category = category
-        item.amount = amount
-        item.is_debit = is_debit
-        item.note = note
-
-        return item
+        """Returns a new TransactionSplit split from self."""
+        return TransactionSplit(
+            self,
+            # Itemized should NOT have this info, otherwise there are some
+            # lovely cycles.
+            matched=False,
+            orders=[],
+            children=[],
+            merchant=desc,
+            category=category,
+            amount=amount,
+            is_debit=is_debit,
+            note=note)
 
     def match(self, orders):
         self.matched = True
@@ -101,7 +150,7 @@ class Transaction(object):
     def bastardize(self):
         """Severes the child from the parent, making this a parent itself."""
         self.is_child = False
-        del self.__dict__['pid']
+        del self.pid
 
     def update_category_id(self, mint_cat_name_to_id):
         # Assert the category name is valid then update the categoryId.
@@ -154,7 +203,7 @@ class Transaction(object):
                 result.append(t)
 
         for pid, children in parent_id_to_trans.items():
-            parent = deepcopy(children[0])
+            parent = copy(children[0])
 
             parent.id = pid
             parent.bastardize()
@@ -178,6 +227,36 @@ class Transaction(object):
         return old_set == new_set
 
 
+class TransactionSplit(object):
+    """A copy-on-write view of a Transaction.
+
+    Only the fields that differ from the parent (e.g. merchant, category,
+    amount, is_debit and note) are stored; everything else is read from the
+    parent Transaction, which is never modified through the view.
+    """
+
+    __slots__ = (
+        'parent', 'amount', 'category', 'category_id', 'children',
+        'is_debit', 'matched', 'merchant', 'note', 'orders')
+
+    def __init__(self, parent, **overrides):
+        self.parent = parent
+        for name, value in overrides.items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name):
+        # Only called for fields that aren't overridden.
+        if name == 'parent' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.parent, name)
+
+    split = Transaction.split
+    update_category_id = Transaction.update_category_id
+    get_compare_tuple = Transaction.get_compare_tuple
+    dry_run_str = Transaction.dry_run_str
+    __repr__ = Transaction.__repr__
+
+
 def itemize_new_trans(new_trans, prefix):
     # Add a prefix to all itemized transactions for easy keyword searching
     # within Mint. Use the same prefix, based on if the original transaction
@@ -211,12 +290,11 @@ def summarize_new_trans(t, new_trans, prefix):
             [' - ' + nt.merchant
              for nt in new_trans]))
 
-    summary_trans = deepcopy(t)
-    summary_trans.merchant = title
     if len([nt for nt in new_trans
             if nt.merchant not in NON_ITEM_MERCHANTS]) == 1:
-        summary_trans.category = new_trans[0].category
+        summary_category = new_trans[0].category
     else:
-        summary_trans.category = category.DEFAULT_MINT_CATEGORY
-    summary_trans.note = notes
+        summary_category = category.DEFAULT_MINT_CATEGORY
+    summary_trans = TransactionSplit(
+        t, merchant=title, category=summary_category, note=notes)
     return [summary_trans]
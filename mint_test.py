@@ -1,4 +1,5 @@
 from datetime import datetime, date
+import pickle
 import unittest
 
 import category
@@ -73,6 +74,25 @@ class TransactionClass(unittest.TestCase):
         self.assertEqual(trans.amount, -423120000)
         self.assertFalse(trans.is_debit)
 
+    def test_pickle(self):
+        trans = transaction(pid=123)
+        trans.some_new_mint_field = 'abc'
+
+        unpickled = pickle.loads(pickle.dumps(trans))
+        self.assertEqual(unpickled.amount, trans.amount)
+        self.assertEqual(unpickled.pid, 123)
+        self.assertEqual(unpickled.some_new_mint_field, 'abc')
+        self.assertEqual(unpickled.orders, [])
+
+        # Pickles from before Transaction had __slots__.
+        old_style = Transaction.__new__(Transaction)
+        old_style.__setstate__({'amount': 5, 'merchant': 'Old'})
+        self.assertEqual(old_style.amount, 5)
+        self.assertEqual(old_style.merchant, 'Old')
+        self.assertFalse(old_style.matched)
+        self.assertEqual(old_style.orders, [])
+        self.assertEqual(old_style.children, [])
+
     def test_split(self):
         trans = transaction()
         strans = trans.split(1234, 'Shopping', 'Some new item', 'Test note')
@@ -82,6 +102,37 @@ class TransactionClass(unittest.TestCase):
         self.assertEqual(strans.merchant, 'Some new item')
         self.assertEqual(strans.note, 'Test note')
 
+    def test_split_is_copy_on_write(self):
+        trans = transaction(id=42, date='3/1/14')
+        trans.match(['an order'])
+        strans = trans.split(1234, 'Shopping', 'Some new item', 'Test note',
+                             is_debit=False)
+
+        # Shared with the parent:
+        self.assertEqual(strans.id, 42)
+        self.assertEqual(strans.date, date(2014, 3, 1))
+        self.assertEqual(strans.omerchant, 'AMAZON MKTPLACE PMTS')
+        # Overridden:
+        self.assertFalse(strans.is_debit)
+        self.assertFalse(strans.matched)
+        self.assertEqual(strans.orders, [])
+        self.assertEqual(strans.children, [])
+        self.assertEqual(
+            strans.get_compare_tuple(), ('Some new item', '$0.00', 'Shopping'))
+        self.assertTrue('Some new item' in strans.dry_run_str())
+
+        strans.merchant = 'Prefix: ' + strans.merchant
+        strans.update_category_id(category.DEFAULT_MINT_CATEGORIES_TO_IDS)
+        self.assertEqual(strans.merchant, 'Prefix: Some new item')
+        self.assertEqual(strans.category_id, 2)
+
+        # The parent is untouched.
+        self.assertEqual(trans.merchant, 'Amazon')
+        self.assertEqual(trans.category, 'Personal Care')
+        self.assertEqual(trans.category_id, 4)
+        self.assertEqual(trans.amount, 11950000)
+        self.assertTrue(trans.matched)
+
     def test_match(self):
         trans = transaction()
         orders = [1, 2, 3]
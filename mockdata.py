@@ -1,4 +1,6 @@
 from collections import OrderedDict
+import csv
+import io
 
 import amazon
 import mint
@@ -20,6 +22,21 @@ def refund(*args, **kwargs):
     return amazon.Refund(refund_dict(*args, **kwargs))
 
 
+def csv_file(dicts, no_data_header=None):
+    """Returns an in-memory Amazon report with a row per dict."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if no_data_header:
+        writer.writerow(no_data_header)
+        writer.writerow(['No data found for this time period'])
+    else:
+        writer.writerow(dicts[0].keys())
+        for d in dicts:
+            writer.writerow(d.values())
+    out.seek(0)
+    return out
+
+
 def transaction_json(
         amount='$11.95',
         is_debit=True,
@@ -0,0 +1,161 @@
+from collections import Counter
+
+from currency import CENT_MICRO_USD, MICRO_USD_EPS
+
+# How many search states a single partition may explore before giving up.
+# A state costs on the order of a microsecond.
+DEFAULT_MAX_STATES_PER_PARTITION = 1000000
+
+
+class SearchBudgetExhausted(Exception):
+    pass
+
+
+class SearchBudget:
+    """Limits how many states a search may explore.
+
+    The search calls spend() as it goes, which raises SearchBudgetExhausted
+    once the limit is passed. Unlike a wall clock timeout this gives the same
+    answer on every machine, and works off the main thread.
+    """
+
+    def __init__(self, max_states=None):
+        self.max_states = max_states
+        self.states = 0
+
+    def spend(self):
+        self.states += 1
+        if self.max_states is not None and self.states > self.max_states:
+            raise SearchBudgetExhausted()
+
+
+def partition_by_subtotals(values, targets, eps=MICRO_USD_EPS, budget=None):
+    """Partitions values into len(targets) groups, one per target.
+
+    Every group must be non-empty and sum to within eps of its target. This
+    is how the items of an order are divvied up amongst its shipments when
+    tracking numbers can't tell them apart, so values and targets are
+    integer micro dollar subtotals.
+
+    Returns a list holding the target index for each value, or None when no
+    such partition exists. Raises SearchBudgetExhausted if budget (a
+    SearchBudget) runs out before finding either.
+
+    Targets are filled one at a time, smallest first (as it has the fewest
+    ways to be made), each by a depth first search over how many copies of
+    each distinct value it takes. It's pruned by:
+     - identical values only being counted, never permuted;
+     - which sums the values left over can still reach (for non-negative,
+       whole cent amounts) both while filling a target and for the targets
+       after it;
+     - remembering the leftover values that are already known to fail.
+    """
+    n = len(values)
+    m = len(targets)
+    if n < m or (m == 0 and n > 0):
+        return None
+    if abs(sum(values) - sum(targets)) >= eps * max(m, 1):
+        return None
+    if n == 0:
+        return []
+    if budget is None:
+        budget = SearchBudget()
+
+    distinct = sorted(Counter(values).items(), key=lambda vc: -vc[0])
+    distinct_values = [v for v, _ in distinct]
+    num_distinct = len(distinct)
+    counts = [c for _, c in distinct]
+    in_cents = all(
+        v >= 0 and v % CENT_MICRO_USD == 0
+        for v in distinct_values + list(targets))
+    order = sorted(range(m), key=lambda b: targets[b])
+    taken_per_target = [None] * m
+    failed = set()
+
+    def get_suffix_reachable():
+        """Bitsets of the sums (in cents) that some subset of the leftover
+        values at distinct index d and on can make, for each d."""
+        suffix_reachable = [1] * (num_distinct + 1)
+        for d in range(num_distinct - 1, -1, -1):
+            reachable = suffix_reachable[d + 1]
+            for _ in range(counts[d]):
+                reachable |= reachable << (distinct_values[d] //
+                                           CENT_MICRO_USD)
+            suffix_reachable[d] = reachable
+        return suffix_reachable
+
+    def is_reachable(suffix_reachable, d, amount):
+        if not in_cents:
+            return True
+        return amount >= 0 and suffix_reachable[d] >> (
+            amount // CENT_MICRO_USD) & 1
+
+    def fillings(target):
+        """Yields the non-empty counts of leftover values summing to
+        target."""
+        suffix_reachable = get_suffix_reachable() if in_cents else None
+        taken = [0] * num_distinct
+
+        def take(d, left, size):
+            budget.spend()
+            if d == num_distinct:
+                if size and abs(left) < eps:
+                    yield taken
+                return
+            if not is_reachable(suffix_reachable, d, left):
+                return
+            value = distinct_values[d]
+            most = counts[d]
+            if in_cents and value > 0:
+                most = min(most, left // value)
+            for k in range(most, -1, -1):
+                taken[d] = k
+                yield from take(d + 1, left - k * value, size + k)
+            taken[d] = 0
+
+        return take(0, target, 0)
+
+    def is_viable(i):
+        """Whether the leftover values could still fill order[i] on."""
+        if sum(counts) < m - i:
+            return False
+        if not in_cents:
+            return True
+        suffix_reachable = get_suffix_reachable()
+        return all(
+            is_reachable(suffix_reachable, 0, targets[b]) for b in order[i:])
+
+    def fill(i):
+        """Fills the targets from order[i] on with the leftover values."""
+        b = order[i]
+        if i == m - 1:
+            # The last target takes whatever is left.
+            left = sum(v * c for v, c in zip(distinct_values, counts))
+            if not any(counts) or abs(left - targets[b]) >= eps:
+                return False
+            taken_per_target[b] = list(counts)
+            return True
+        key = (i, tuple(counts))
+        if key in failed:
+            return False
+        for taken in fillings(targets[b]):
+            taken = list(taken)
+            for d, k in enumerate(taken):
+                counts[d] -= k
+            if is_viable(i + 1) and fill(i + 1):
+                taken_per_target[b] = taken
+                return True
+            for d, k in enumerate(taken):
+                counts[d] += k
+        failed.add(key)
+        return False
+
+    if not is_viable(0) or not fill(0):
+        return None
+
+    # Hand out the targets to the values, in the order they were given.
+    targets_per_value = {v: [] for v in distinct_values}
+    for b, taken in enumerate(taken_per_target):
+        for v, k in zip(distinct_values, taken):
+            targets_per_value[v].extend([b] * k)
+    return [targets_per_value[v].pop() for v in values]
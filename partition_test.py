@@ -0,0 +1,106 @@
+import random
+import time
+import unittest
+
+from partition import partition_by_subtotals
+from partition import SearchBudget, SearchBudgetExhausted
+
+
+def group_sums(values, targets, grouping):
+    sums = [0] * len(targets)
+    for value, target in zip(values, grouping):
+        sums[target] += value
+    return sums
+
+
+class PartitionBySubtotals(unittest.TestCase):
+    def test_trivial(self):
+        self.assertEqual(partition_by_subtotals([], []), [])
+        self.assertEqual(
+            partition_by_subtotals([1000000, 2000000], [3000000]), [0, 0])
+        self.assertIsNone(partition_by_subtotals([1000000], []))
+        self.assertIsNone(partition_by_subtotals([], [1000000]))
+
+    def test_small(self):
+        values = [2000000, 5000000, 3000000, 1000000]
+        targets = [6000000, 5000000]
+        grouping = partition_by_subtotals(values, targets)
+        self.assertEqual(group_sums(values, targets, grouping), targets)
+
+    def test_tolerates_eps(self):
+        values = [1000005, 2000000]
+        self.assertEqual(
+            partition_by_subtotals(values, [1000000, 2000000]), [0, 1])
+
+    def test_identical_values(self):
+        values = [2000000] * 8
+        targets = [4000000, 12000000]
+        grouping = partition_by_subtotals(values, targets)
+        self.assertEqual(grouping.count(0), 2)
+        self.assertEqual(grouping.count(1), 6)
+
+    def test_groups_are_non_empty(self):
+        self.assertIsNone(
+            partition_by_subtotals([3000000, 0], [3000000, 0, 0]))
+        grouping = partition_by_subtotals([3000000, 0], [3000000, 0])
+        self.assertEqual(grouping, [0, 1])
+
+    def test_no_solution(self):
+        # Totals don't match.
+        self.assertIsNone(
+            partition_by_subtotals([1000000, 2000000], [1000000, 1000000]))
+        # Totals match, but no subset makes the targets.
+        self.assertIsNone(
+            partition_by_subtotals(
+                [4000000, 4000000, 2000000], [5000000, 5000000]))
+        # Fewer values than targets.
+        self.assertIsNone(
+            partition_by_subtotals([2000000], [1000000, 1000000]))
+
+    def test_negative_values(self):
+        values = [5000000, -1000000, 3000000, -2000000]
+        targets = [4000000, 1000000]
+        grouping = partition_by_subtotals(values, targets)
+        self.assertEqual(group_sums(values, targets, grouping), targets)
+
+    def test_many_items_many_shipments(self):
+        rand = random.Random(42)
+        for num_values, num_distinct in [(36, 6), (32, 32), (40, 40)]:
+            prices = [rand.randint(100, 20000) * 10000
+                      for _ in range(num_distinct)]
+            values = [prices[i % num_distinct] for i in range(num_values)]
+            shipments = [i % 5 for i in range(num_values)]
+            rand.shuffle(shipments)
+            targets = group_sums(values, [0] * 5, shipments)
+
+            start_time = time.time()
+            grouping = partition_by_subtotals(values, targets)
+            self.assertLess(time.time() - start_time, 1)
+
+            self.assertEqual(group_sums(values, targets, grouping), targets)
+            self.assertEqual(set(grouping), set(range(5)))
+
+    def test_budget(self):
+        rand = random.Random(7)
+        values = [rand.randint(100, 20000) * 10000 for _ in range(30)]
+        shipments = [i % 5 for i in range(30)]
+        targets = group_sums(values, [0] * 5, shipments)
+
+        budget = SearchBudget()
+        partition_by_subtotals(values, targets, budget=budget)
+        states = budget.states
+        self.assertGreater(states, 0)
+
+        # The same search explores the same states every time.
+        budget = SearchBudget(states)
+        self.assertIsNotNone(
+            partition_by_subtotals(values, targets, budget=budget))
+        self.assertEqual(budget.states, states)
+
+        with self.assertRaises(SearchBudgetExhausted):
+            partition_by_subtotals(
+                values, targets, budget=SearchBudget(states - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+
+import mint
+
+# Mint dates are stored as m/d/y, as Mint's own year-less "Mon dd" dates
+# would be read back as being in whatever year it is then.
+MINT_DATE_FORMAT = '%m/%d/%y'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    pid INTEGER,
+    date TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    merchant TEXT NOT NULL,
+    json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_by_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_by_amount ON transactions (amount);
+CREATE INDEX IF NOT EXISTS transactions_by_merchant
+    ON transactions (merchant);
+CREATE INDEX IF NOT EXISTS transactions_by_pid ON transactions (pid);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class MintStore:
+    """A local SQLite copy of Mint transactions and categories.
+
+    Each transaction is kept as the JSON Mint gave for it, alongside indexed
+    columns for its date, amount, merchant and parent id, so a run only
+    loads the transactions it needs. Metadata, like when Mint was last
+    synced, is kept as key/value strings.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def upsert_transactions(self, json_dicts, since=None):
+        """Adds or replaces transactions from Mint's JSON, by id. Returns
+        how many there were.
+
+        With since (a date), the json_dicts are taken to be every
+        transaction from then on, so any others stored from then on (e.g.
+        deleted in Mint) are removed.
+        """
+        rows = []
+        for raw_dict in json_dicts:
+            # Parsing modifies the dict it's given.
+            t = mint.Transaction(dict(raw_dict))
+            raw_dict = dict(
+                raw_dict,
+                date=t.date.strftime(MINT_DATE_FORMAT),
+                odate=t.odate.strftime(MINT_DATE_FORMAT))
+            # Only splits have a parent id.
+            rows.append((
+                t.id, getattr(t, 'pid', None), t.date.isoformat(), t.amount,
+                t.merchant, json.dumps(raw_dict)))
+        with self.conn:
+            if since:
+                self.conn.execute(
+                    'DELETE FROM transactions WHERE date >= ?',
+                    (since.isoformat(),))
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO transactions '
+                '(id, pid, date, amount, merchant, json) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+        return len(rows)
+
+    def get_transactions(self, start_date=None, end_date=None, amount=None,
+                         merchant=None, pid=None):
+        """Returns the mint.Transactions matching every criteria given: dated
+        from start_date to end_date (inclusive), of amount (in micro
+        dollars), with merchant, or with parent id pid. They are ordered by
+        date, then id."""
+        clauses = []
+        params = []
+        if start_date:
+            clauses.append('date >= ?')
+            params.append(start_date.isoformat())
+        if end_date:
+            clauses.append('date <= ?')
+            params.append(end_date.isoformat())
+        for column, value in (
+                ('amount', amount), ('merchant', merchant), ('pid', pid)):
+            if value is not None:
+                clauses.append('{} = ?'.format(column))
+                params.append(value)
+        query = 'SELECT json FROM transactions'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY date, id'
+        return mint.Transaction.parse_from_json(
+            json.loads(row[0]) for row in self.conn.execute(query, params))
+
+    def __len__(self):
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM transactions').fetchone()[0]
+
+    def set_categories(self, name_to_id):
+        """Replaces the Mint category name to id map."""
+        with self.conn:
+            self.conn.execute('DELETE FROM categories')
+            self.conn.executemany(
+                'INSERT INTO categories (name, id) VALUES (?, ?)',
+                name_to_id.items())
+
+    def get_categories(self):
+        return dict(self.conn.execute('SELECT name, id FROM categories'))
+
+    def set_metadata(self, key, value):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
+                (key, str(value)))
+
+    def get_metadata(self, key, default=None):
+        row = self.conn.execute(
+            'SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
@@ -0,0 +1,98 @@
+from datetime import date
+import os
+import tempfile
+import unittest
+
+from dates import current_year
+from mockdata import transaction_json
+from store import MintStore
+
+
+class MintStoreClass(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'mint.sqlite')
+        self.store = MintStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_upsert_and_get_transactions(self):
+        self.assertEqual(self.store.upsert_transactions([
+            transaction_json(id=1, date='2/27/14', amount='$5.00'),
+            transaction_json(id=2, date='2/28/14', merchant='Target'),
+            transaction_json(id=3, date='3/1/14', pid=2),
+        ]), 3)
+        self.assertEqual(len(self.store), 3)
+
+        def get_ids(**criteria):
+            return [t.id for t in self.store.get_transactions(**criteria)]
+
+        self.assertEqual(get_ids(), [1, 2, 3])
+        self.assertEqual(get_ids(start_date=date(2014, 2, 28)), [2, 3])
+        self.assertEqual(get_ids(end_date=date(2014, 2, 28)), [1, 2])
+        self.assertEqual(get_ids(amount=5000000), [1])
+        self.assertEqual(get_ids(merchant='Target'), [2])
+        self.assertEqual(get_ids(pid=2), [3])
+        self.assertEqual(
+            get_ids(start_date=date(2014, 2, 28), merchant='Amazon'), [3])
+
+        t = self.store.get_transactions(amount=5000000)[0]
+        self.assertEqual(t.date, date(2014, 2, 27))
+        self.assertEqual(t.odate, date(2014, 2, 27))
+        self.assertEqual(t.merchant, 'Amazon')
+        self.assertTrue(t.is_debit)
+
+    def test_upsert_replaces_by_id(self):
+        self.store.upsert_transactions([transaction_json(id=1)])
+        self.store.upsert_transactions(
+            [transaction_json(id=1, merchant='Amazon.com: AAs')])
+
+        trans = self.store.get_transactions()
+        self.assertEqual(len(trans), 1)
+        self.assertEqual(trans[0].merchant, 'Amazon.com: AAs')
+
+    def test_upsert_since(self):
+        self.store.upsert_transactions([
+            transaction_json(id=1, date='2/27/14'),
+            transaction_json(id=2, date='2/28/14'),
+        ])
+        self.store.upsert_transactions(
+            [transaction_json(id=3, date='3/1/14')],
+            since=date(2014, 2, 28))
+
+        self.assertEqual([t.id for t in self.store.get_transactions()], [1, 3])
+
+    def test_keeps_the_year_of_this_years_dates(self):
+        self.store.upsert_transactions([transaction_json(date='Feb 28')])
+
+        self.assertEqual(
+            self.store.get_transactions()[0].date,
+            date(current_year(), 2, 28))
+
+    def test_categories_and_metadata(self):
+        self.assertEqual(self.store.get_categories(), {})
+        self.store.set_categories({'Shopping': 2, 'Books': 202})
+        self.store.set_categories({'Shopping': 2})
+        self.assertEqual(self.store.get_categories(), {'Shopping': 2})
+
+        self.assertEqual(self.store.get_metadata('synced_at'), None)
+        self.assertEqual(
+            self.store.get_metadata('synced_at', 'never'), 'never')
+        self.store.set_metadata('synced_at', '2014-02-28 12:00:00')
+        self.assertEqual(
+            self.store.get_metadata('synced_at'), '2014-02-28 12:00:00')
+
+    def test_persists(self):
+        self.store.upsert_transactions([transaction_json(id=1)])
+        self.store.set_categories({'Shopping': 2})
+        self.store.close()
+
+        self.store = MintStore(self.path)
+        self.assertEqual([t.id for t in self.store.get_transactions()], [1])
+        self.assertEqual(self.store.get_categories(), {'Shopping': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,9 +12,10 @@ import argparse
 import atexit
 from collections import defaultdict, Counter
 import datetime
-import itertools
+import glob
+import hashlib
 import logging
-import pickle
+import os
 import pkg_resources
 import time
 from threading import Thread
@@ -28,11 +29,14 @@ from progress.spinner import Spinner
 import readchar
 
 import amazon
+import cache
 import category
 from currency import micro_usd_nearly_equal
 from currency import micro_usd_to_usd_float
 from currency import micro_usd_to_usd_string
+import matching
 import mint
+import store
 
 
 logger = logging.getLogger(__name__)
@@ -47,6 +51,10 @@ KEYRING_SERVICE_NAME = 'mintapi'
 
 UPDATE_TRANS_ENDPOINT = '/updateTransaction.xevent'
 
+# Bump this when a change to how updates are made could change whether a
+# transaction is up to date, to drop what the update memo has recorded.
+UPDATE_MEMO_VERSION = 1
+
 
 class AsyncProgress:
     def __init__(self, progress):
@@ -81,11 +89,18 @@ def main():
     if args.dry_run:
         logger.info('\nDry Run; no modifications being sent to Mint.\n')
 
+    if args.matching_engine == 'numpy' and not matching.np:
+        logger.error('--matching_engine numpy requires NumPy to be installed.')
+        exit(1)
+
     # Initialize the stats. Explicitly initialize stats that might not be
     # accumulated (conditionals).
     stats = Counter(
         adjust_itemized_tax=0,
         already_up_to_date=0,
+        amount_index_hits=0,
+        amount_index_lookups=0,
+        amount_index_near_hits=0,
         misc_charge=0,
         new_tag=0,
         no_retag=0,
@@ -93,13 +108,30 @@ def main():
         user_skipped_retag=0,
     )
 
-    orders = amazon.Order.parse_from_csv(
-        args.orders_csv, ProgressCounter('Parsing Orders - '))
-    items = amazon.Item.parse_from_csv(
-        args.items_csv, ProgressCounter('Parsing Items - '))
+    report_cache = (
+        None if args.no_cache
+        else cache.ReportCache(os.path.join(args.cache_dir, 'reports')))
+
+    orders = amazon.Order.parse_from_csv_files(
+        args.orders_csv, ProgressCounter('Parsing Orders - '),
+        args.all_amazon_fields, report_cache, args.parse_workers)
+    items = amazon.Item.parse_from_csv_files(
+        args.items_csv, ProgressCounter('Parsing Items - '),
+        args.all_amazon_fields, report_cache, args.parse_workers)
     refunds = ([] if not args.refunds_csv
-               else amazon.Refund.parse_from_csv(
-                   args.refunds_csv, ProgressCounter('Parsing Refunds - ')))
+               else amazon.Refund.parse_from_csv_files(
+                   args.refunds_csv, ProgressCounter('Parsing Refunds - '),
+                   args.all_amazon_fields, report_cache,
+                   args.parse_workers))
+    if report_cache:
+        logger.info('Parsed Amazon report cache: {} hits, {} misses'.format(
+            report_cache.hits, report_cache.misses))
+    partition_memo = (
+        None if args.no_cache
+        else cache.LruMemo(os.path.join(args.cache_dir, 'partitions.pickle')))
+    update_memo = (
+        None if args.no_cache
+        else cache.LruMemo(os.path.join(args.cache_dir, 'updates.pickle')))
 
     mint_client = None
 
@@ -109,28 +141,51 @@ def main():
 
     atexit.register(close_mint_client)
 
-    if args.pickled_epoch:
+    # Only get transactions as new as the oldest Amazon order.
+    oldest_trans_date = min([o.order_date for o in orders])
+    if refunds:
+        oldest_trans_date = min(
+            oldest_trans_date,
+            min([o.order_date for o in refunds]))
+
+    # With --no_cache, only an explicitly given store is read or written.
+    mint_store_path = args.mint_store or (
+        None if args.no_cache
+        else os.path.join(args.cache_dir, 'mint.sqlite'))
+    if args.use_mint_store:
+        if not mint_store_path or not os.path.exists(mint_store_path):
+            logger.error('--use_mint_store requires an existing --mint_store '
+                         '(or --cache_dir without --no_cache).')
+            exit(1)
+        mint_store = store.MintStore(mint_store_path)
         mint_trans, mint_category_name_to_id = (
-            get_trans_and_categories_from_pickle(args.pickled_epoch))
+            get_trans_and_categories_from_store(mint_store, oldest_trans_date))
+        mint_store.close()
     else:
         mint_client = get_mint_client(args)
 
-        # Only get transactions as new as the oldest Amazon order.
-        oldest_trans_date = min([o.order_date for o in orders])
-        if refunds:
-            oldest_trans_date = min(
-                oldest_trans_date,
-                min([o.order_date for o in refunds]))
         mint_transactions_json, mint_category_name_to_id = (
             get_trans_and_categories_from_mint(mint_client, oldest_trans_date))
-        epoch = int(time.time())
+        if mint_store_path:
+            mint_store = store.MintStore(mint_store_path)
+            save_trans_and_categories(
+                mint_store, mint_transactions_json, mint_category_name_to_id,
+                oldest_trans_date)
+            mint_store.close()
         mint_trans = mint.Transaction.parse_from_json(mint_transactions_json)
-        dump_trans_and_categories(mint_trans, mint_category_name_to_id, epoch)
 
     updates = get_mint_updates(
         orders, items, refunds,
         mint_trans,
-        args, stats, mint_category_name_to_id)
+        args, stats, mint_category_name_to_id, partition_memo, update_memo)
+    if partition_memo is not None:
+        partition_memo.save()
+        logger.info('Shipment partition memo: {} hits, {} misses'.format(
+            partition_memo.hits, partition_memo.misses))
+    if update_memo is not None:
+        update_memo.save()
+        logger.info('Update memo: {} hits, {} misses'.format(
+            update_memo.hits, update_memo.misses))
 
     log_amazon_stats(items, orders, refunds)
     log_processing_stats(stats)
@@ -156,7 +211,8 @@ def get_mint_updates(
         orders, items, refunds,
         trans,
         args, stats,
-        mint_category_name_to_id=category.DEFAULT_MINT_CATEGORIES_TO_IDS):
+        mint_category_name_to_id=category.DEFAULT_MINT_CATEGORIES_TO_IDS,
+        partition_memo=None, update_memo=None):
     def get_prefix(is_debit):
         return (args.description_prefix if is_debit
                 else args.description_return_prefix)
@@ -176,8 +232,17 @@ def get_mint_updates(
     itemProgress = IncrementalBar(
         'Matching Amazon Items with Orders',
         max=len(items))
-    amazon.associate_items_with_orders(orders, items, itemProgress)
+    over_budget = amazon.associate_items_with_orders(
+        orders, items, itemProgress,
+        args.max_partition_states_per_order, args.max_partition_states,
+        args.association_workers, partition_memo)
     itemProgress.finish()
+    stats['orders_over_budget'] = len(over_budget)
+    for oid, num_items, num_shipments in over_budget:
+        logger.info(
+            'Order {} ran out of search budget splitting {} items amongst {} '
+            'shipments; consider raising --max_partition_states_per_order or '
+            '--max_partition_states.'.format(oid, num_items, num_shipments))
 
     # Only match orders that have items.
     orders = [o for o in orders if o.items]
@@ -199,7 +264,9 @@ def get_mint_updates(
     orderMatchProgress = IncrementalBar(
         'Matching Amazon Orders w/ Mint Trans',
         max=len(orders))
-    match_transactions(trans, orders, orderMatchProgress)
+    match_transactions(
+        trans, orders, orderMatchProgress, get_consolidated_args(args),
+        args.matching_engine, stats)
     orderMatchProgress.finish()
 
     unmatched_trans = [t for t in trans if not t.orders]
@@ -208,7 +275,9 @@ def get_mint_updates(
     refundMatchProgress = IncrementalBar(
         'Matching Amazon Refunds w/ Mint Trans',
         max=len(refunds))
-    match_transactions(unmatched_trans, refunds, refundMatchProgress)
+    match_transactions(
+        unmatched_trans, refunds, refundMatchProgress,
+        get_consolidated_args(args), args.matching_engine, stats)
     refundMatchProgress.finish()
 
     unmatched_orders = [o for o in orders if not o.matched]
@@ -232,12 +301,33 @@ def get_mint_updates(
     stats['skipped_orders_gift_card'] = num_gift_card
     stats['skipped_orders_unshipped'] = num_unshipped
 
+    # Skip the transactions that an earlier run found to need no update,
+    # if nothing that decides their update has changed since.
+    fingerprints = {}
+    if update_memo is not None:
+        todo_trans = []
+        for t in matched_trans:
+            fingerprint = get_update_fingerprint(t, args)
+            outcome = update_memo.get(fingerprint)
+            if outcome:
+                stats[outcome] += 1
+            else:
+                fingerprints[id(t)] = fingerprint
+                todo_trans.append(t)
+        matched_trans = todo_trans
+
+    def remember_outcome(t, outcome):
+        stats[outcome] += 1
+        if update_memo is not None:
+            update_memo[fingerprints[id(t)]] = outcome
+
     merged_orders = []
     merged_refunds = []
 
-    updateCounter = IncrementalBar('Determining Mint Updates')
-    updates = []
-    for t in updateCounter.iter(matched_trans):
+    # Merge and fix up the orders of every transaction first, then spread
+    # the per item tax differences of each order.
+    order_by_trans = {}
+    for t in matched_trans:
         if t.is_debit:
             order = amazon.Order.merge(t.orders)
             merged_orders.extend(orders)
@@ -249,8 +339,16 @@ def get_mint_updates(
             # that out across the items instead.
             # if order.attribute_itemized_diff_to_shipping_tax():
             #     stats['add_shipping_tax'] += 1
-            if order.attribute_itemized_diff_to_per_item_tax():
-                stats['adjust_itemized_tax'] += 1
+            order_by_trans[id(t)] = order
+    stats['adjust_itemized_tax'] += (
+        amazon.Order.attribute_itemized_diffs_to_per_item_tax(
+            order_by_trans.values()))
+
+    updateCounter = IncrementalBar('Determining Mint Updates')
+    updates = []
+    for t in updateCounter.iter(matched_trans):
+        if t.is_debit:
+            order = order_by_trans[id(t)]
 
             assert micro_usd_nearly_equal(t.amount, order.total_charged)
             assert micro_usd_nearly_equal(t.amount, order.total_by_subtotals())
@@ -286,7 +384,7 @@ def get_mint_updates(
 
         if mint.Transaction.old_and_new_are_identical(
                 t, new_transactions, ignore_category=args.no_tag_categories):
-            stats['already_up_to_date'] += 1
+            remember_outcome(t, 'already_up_to_date')
             continue
 
         if t.merchant.startswith(prefix):
@@ -306,7 +404,7 @@ def get_mint_updates(
                     continue
                 stats['retag'] += 1
             elif not args.retag_changed:
-                stats['no_retag'] += 1
+                remember_outcome(t, 'no_retag')
                 continue
             else:
                 stats['retag'] += 1
@@ -320,29 +418,40 @@ def get_mint_updates(
     return updates
 
 
-def mark_best_as_matched(t, list_of_orders_or_refunds, progress=None):
-    if not list_of_orders_or_refunds:
-        return
+def get_update_fingerprint(t, args):
+    """A digest of everything that decides the update for t, a matched Mint
+    transaction: t and its splits as Mint has them, the Amazon records it
+    was matched with, and the flags that change how it's tagged."""
+    amazon_records = []
+    for o in t.orders:
+        amazon_records.append(amazon.get_record_fingerprint(o))
+        amazon_records.extend(
+            amazon.get_record_fingerprint(i)
+            for i in getattr(o, 'items', []))
+    fingerprint = (
+        UPDATE_MEMO_VERSION,
+        t.id,
+        t.get_compare_tuple(),
+        sorted(c.get_compare_tuple() for c in t.children),
+        amazon_records,
+        args.description_prefix,
+        args.description_return_prefix,
+        args.verbose_itemize,
+        args.no_itemize,
+        args.no_tag_categories,
+        args.prompt_retag,
+        args.retag_changed,
+    )
+    return hashlib.sha256(repr(fingerprint).encode('utf-8')).hexdigest()
 
-    # Only consider it a match if the posted date (transaction date) is
-    # within 3 days of the ship date of the order.
-    closest_match = None
-    closest_match_num_days = 365  # Large number
 
-    for orders in list_of_orders_or_refunds:
-        an_order = next(o for o in orders if o.transact_date())
-        if not an_order:
-            continue
-        num_days = (t.odate - an_order.transact_date()).days
-        # TODO: consider orders even if it has a matched_transaction if this
-        # transaction is closer.
-        already_matched = any([o.matched for o in orders])
-        if (abs(num_days) < 4 and
-                abs(num_days) < closest_match_num_days and
-                not already_matched):
-            closest_match = orders
-            closest_match_num_days = abs(num_days)
+def mark_best_as_matched(t, match_index, progress=None):
+    # TODO: consider orders even if it has a matched_transaction if this
+    # transaction is closer.
+    mark_as_matched(t, match_index.pop_best(t.amount, t.odate), progress)
+
 
+def mark_as_matched(t, closest_match, progress=None):
     if closest_match:
         for o in closest_match:
             o.match(t)
@@ -350,37 +459,69 @@ def mark_best_as_matched(t, list_of_orders_or_refunds, progress=None):
         if progress: progress.next(len(closest_match))
 
 
-def match_transactions(unmatched_trans, unmatched_orders, progress=None):
-    # Also works with Refund objects.
-    # First pass: Match up transactions that exactly equal an order's charged
-    # amount.
-    amount_to_orders = defaultdict(list)
+def get_consolidated_args(args):
+    if not args.match_consolidated_charges:
+        return None
+    return {
+        'max_orders': args.consolidated_max_orders,
+        'window_days': args.consolidated_window_days,
+    }
 
-    for o in unmatched_orders:
-        amount_to_orders[o.transact_amount()].append([o])
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_orders[t.amount], progress)
+def match_transactions(
+        unmatched_trans, unmatched_orders, progress=None,
+        consolidated_args=None, engine='python', stats=None):
+    # Also works with Refund objects.
+    # First pass: Match up transactions that (nearly) equal an order's
+    # charged amount.
+    if engine == 'numpy':
+        matches = [
+            [o] if o else None
+            for o in matching.match_amounts_numpy(
+                unmatched_trans, unmatched_orders)]
+    elif engine == 'optimal':
+        matches = [
+            [o] if o else None
+            for o in matching.match_amounts_optimal(
+                unmatched_trans, unmatched_orders)]
+    else:
+        match_index = matching.MatchIndex(
+            (o.transact_amount(), [o]) for o in unmatched_orders)
+        matches = [
+            match_index.pop_best(t.amount, t.odate) for t in unmatched_trans]
+    for t, closest_match in zip(unmatched_trans, matches):
+        mark_as_matched(t, closest_match, progress)
+
+    if stats is not None:
+        stats['amount_index_lookups'] += len(unmatched_trans)
+        stats['amount_index_hits'] += len([m for m in matches if m])
+        stats['amount_index_near_hits'] += len([
+            t for t, m in zip(unmatched_trans, matches)
+            if m and m[0].transact_amount() != t.amount])
 
     unmatched_orders = [o for o in unmatched_orders if not o.matched]
     unmatched_trans = [t for t in unmatched_trans if not t.orders]
 
     # Second pass: Match up transactions to a combination of orders (sometimes
     # they are charged together).
-    oid_to_orders = defaultdict(list)
-    for o in unmatched_orders:
-        oid_to_orders[o.order_id].append(o)
-    amount_to_orders = defaultdict(list)
-    for orders_same_id in oid_to_orders.values():
-        combos = []
-        for r in range(2, len(orders_same_id) + 1):
-            combos.extend(itertools.combinations(orders_same_id, r))
-        for c in combos:
-            orders_total = sum([o.transact_amount() for o in c])
-            amount_to_orders[orders_total].append(c)
+    match_index = matching.CombinedChargeIndex(unmatched_orders)
+
+    for t in unmatched_trans:
+        mark_best_as_matched(t, match_index, progress)
+
+    if consolidated_args is None:
+        return
+
+    unmatched_orders = [o for o in unmatched_orders if not o.matched]
+    unmatched_trans = [t for t in unmatched_trans if not t.orders]
+
+    # Third pass: Match up transactions to a combination of orders with
+    # different order ids (sometimes Amazon consolidates charges).
+    match_index = matching.ConsolidatedChargeIndex(
+        unmatched_orders, **consolidated_args)
 
     for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_orders[t.amount], progress)
+        mark_best_as_matched(t, match_index, progress)
 
 
 def get_mint_client(args):
@@ -412,31 +553,30 @@ def get_mint_client(args):
     return mint_client
 
 
-MINT_TRANS_PICKLE_FMT = 'Mint {} Transactions.pickle'
-MINT_CATS_PICKLE_FMT = 'Mint {} Categories.pickle'
-
-
-def get_trans_and_categories_from_pickle(pickle_epoch):
-    label = 'Un-pickling Mint transactions from epoch: {} '.format(
-        pickle_epoch)
+def get_trans_and_categories_from_store(mint_store, oldest_trans_date):
+    synced_at = mint_store.get_metadata('synced_at')
+    if synced_at is None:
+        logger.error('The local Mint store was never synced. Run once '
+                     'without --use_mint_store first.')
+        exit(1)
+    label = 'Loading Mint transactions from local store, synced {} '.format(
+        synced_at)
     asyncSpin = AsyncProgress(Spinner(label))
-    with open(MINT_TRANS_PICKLE_FMT.format(pickle_epoch), 'rb') as f:
-        trans = pickle.load(f)
-    with open(MINT_CATS_PICKLE_FMT.format(pickle_epoch), 'rb') as f:
-        cats = pickle.load(f)
+    trans = mint_store.get_transactions(start_date=oldest_trans_date)
+    cats = mint_store.get_categories()
     asyncSpin.finish()
 
     return trans, cats
 
 
-def dump_trans_and_categories(trans, cats, pickle_epoch):
-    label = 'Backing up Mint to local pickle file, epoch: {} '.format(
-        pickle_epoch)
-    asyncSpin = AsyncProgress(Spinner(label))
-    with open(MINT_TRANS_PICKLE_FMT.format(pickle_epoch), 'wb') as f:
-        pickle.dump(trans, f)
-    with open(MINT_CATS_PICKLE_FMT.format(pickle_epoch), 'wb') as f:
-        pickle.dump(cats, f)
+def save_trans_and_categories(
+        mint_store, trans_json, cats, oldest_trans_date):
+    asyncSpin = AsyncProgress(Spinner(
+        'Saving Mint transactions to the local store '))
+    mint_store.upsert_transactions(trans_json, since=oldest_trans_date)
+    mint_store.set_categories(cats)
+    mint_store.set_metadata(
+        'synced_at', datetime.datetime.now().isoformat(' ', 'seconds'))
     asyncSpin.finish()
 
 
@@ -521,9 +661,13 @@ def log_processing_stats(stats):
         '{refund_unmatch})\n'
         'Transactions matched w/ orders/refunds: {trans_match} (unmatched: '
         '{trans_unmatch})\n'
+        'Amount index hits: {amount_index_hits} of {amount_index_lookups} '
+        'lookups ({amount_index_near_hits} off by under a cent)\n'
         '\n'
         'Orders skipped: not shipped: {skipped_orders_unshipped}\n'
         'Orders skipped: gift card used: {skipped_orders_gift_card}\n'
+        'Orders skipped: out of search budget splitting items: '
+        '{orders_over_budget}\n'
         '\n'
         'Order fix-up: incorrect tax itemization: {adjust_itemized_tax}\n'
         'Order fix-up: has a misc charges (e.g. gift wrap): {misc_charge}\n'
@@ -659,6 +803,29 @@ def s_to_time(s):
     return datetime.time(hour=dur_h, minute=dur_m, second=dur_s)
 
 
+def amazon_reports(arg):
+    """An argparse type for one or more Amazon reports.
+
+    arg is a comma separated list of paths or glob patterns (or "-" for
+    stdin). Each report may be compressed.
+    """
+    paths = []
+    for pattern in arg.split(','):
+        if pattern == '-' or not glob.has_magic(pattern):
+            paths.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise argparse.ArgumentTypeError(
+                'no reports match \'{}\''.format(pattern))
+        paths.extend(matches)
+    try:
+        return [amazon.open_report(p) for p in paths]
+    except OSError as e:
+        raise argparse.ArgumentTypeError(
+            'can\'t open \'{}\': {}'.format(e.filename, e.strerror))
+
+
 def define_args(parser):
     # Mint creds:
     parser.add_argument(
@@ -672,13 +839,17 @@ def define_args(parser):
 
     # Inputs:
     parser.add_argument(
-        'items_csv', type=argparse.FileType('r'),
-        help='The "Items" Order History Report from Amazon')
+        'items_csv', type=amazon_reports,
+        help=('The "Items" Order History Report from Amazon. Can be gzip, xz '
+              'or zip compressed, or "-" for stdin. Reports from several '
+              'accounts or date ranges can be given as a comma separated '
+              'list of files or globs (e.g. "Items*.csv.gz"); overlapping '
+              'rows are only counted once. All reports accept the same.'))
     parser.add_argument(
-        'orders_csv', type=argparse.FileType('r'),
+        'orders_csv', type=amazon_reports,
         help='The "Orders and Shipments" Order History Report from Amazon')
     parser.add_argument(
-        '--refunds_csv', type=argparse.FileType('r'),
+        '--refunds_csv', type=amazon_reports,
         help='The "Refunds" Order History Report from Amazon. '
              'This is optional.')
 
@@ -693,12 +864,90 @@ def define_args(parser):
         help=('Do not split Mint transactions into individual items with '
               'attempted categorization.'))
 
+    # Caching:
+    parser.add_argument(
+        '--cache_dir', type=str,
+        default=cache.DEFAULT_CACHE_DIR,
+        help=('Where to keep cached data between runs, like the parsed '
+              'Amazon reports, how items were split amongst shipments, and '
+              'which transactions were already up to date. '
+              'Default is "{}".'.format(
+                  cache.DEFAULT_CACHE_DIR)))
+    parser.add_argument(
+        '--no_cache', action='store_true',
+        help='Do not read or write any cached data.')
+
+    # Associating items with orders:
+    parser.add_argument(
+        '--max_partition_states_per_order', type=int,
+        default=amazon.DEFAULT_MAX_STATES_PER_PARTITION,
+        help=('When items of one order shipped separately can\'t be told '
+              'apart by tracking number, they are split amongst the '
+              'shipments by subtotal. Limit that search to this many '
+              'explored states per order. Orders over budget are left '
+              'unmatched and reported. Default is {}.'.format(
+                  amazon.DEFAULT_MAX_STATES_PER_PARTITION)))
+    parser.add_argument(
+        '--max_partition_states', type=int,
+        help=('Limit the searches above to this many explored states in '
+              'total. Unlimited by default.'))
+    parser.add_argument(
+        '--association_workers', type=int,
+        default=1,
+        help=('Associate the items of orders that shipped separately using '
+              'this many worker processes. Results are identical to using '
+              'one worker.'))
+
+    # Matching transactions with orders:
+    parser.add_argument(
+        '--matching_engine', choices=['python', 'numpy', 'optimal'],
+        default='python',
+        help=('How to match transactions with orders of the same amount. '
+              '"numpy" gives the same matches, but is much faster on long '
+              'histories. It requires NumPy to be installed. "optimal" '
+              'considers all transactions at once rather than one at a '
+              'time, matching as many as possible, as close in date as '
+              'possible, leaving fewer for the slower passes after it.'))
+    parser.add_argument(
+        '--match_consolidated_charges', action='store_true',
+        help=('After matching transactions with orders (or refunds), and '
+              'with combinations of orders with the same order id, try '
+              'matching what is left with combinations of orders across '
+              'order ids. Amazon sometimes charges several orders as one.'))
+    parser.add_argument(
+        '--consolidated_max_orders', type=int,
+        default=matching.DEFAULT_CONSOLIDATED_MAX_ORDERS,
+        help=('The most orders to consider charged as one with '
+              '--match_consolidated_charges. Default is {}.'.format(
+                  matching.DEFAULT_CONSOLIDATED_MAX_ORDERS)))
+    parser.add_argument(
+        '--consolidated_window_days', type=int,
+        default=matching.MAX_MATCH_DAYS,
+        help=('How many days apart a transaction and the orders charged as '
+              'one may be with --match_consolidated_charges. Default is '
+              '{}.'.format(matching.MAX_MATCH_DAYS)))
+
     # Debugging/testing.
     parser.add_argument(
-        '--pickled_epoch', type=int,
-        help=('Do not fetch categories or transactions from Mint. Use this '
-              'pickled epoch instead. If coupled with --dry_run, no '
-              'connection to Mint is established.'))
+        '--mint_store', type=str,
+        help=('The SQLite file where Mint categories and transactions are '
+              'saved after every fetch. Default is "mint.sqlite" in '
+              '--cache_dir, or none with --no_cache.'))
+    parser.add_argument(
+        '--use_mint_store', action='store_true',
+        help=('Do not fetch categories or transactions from Mint. Use those '
+              'saved in --mint_store by the last fetch instead. If coupled '
+              'with --dry_run, no connection to Mint is established.'))
+    parser.add_argument(
+        '--parse_workers', type=int,
+        default=1,
+        help=('Parse large Amazon reports in chunks using this many worker '
+              'processes. Results are identical to parsing with one worker.'))
+    parser.add_argument(
+        '--all_amazon_fields', action='store_true',
+        help=('Keep every column of the Amazon reports on the parsed records. '
+              'By default only the columns needed for tagging are kept, which '
+              'saves memory and parsing time on large reports.'))
     parser.add_argument(
         '--dry_run', action='store_true',
         help=('Do not modify Mint transaction; instead print the proposed '
@@ -1,8 +1,15 @@
+import argparse
 from collections import Counter
+import os
+import tempfile
 import unittest
 
+import cache
+import matching
+import store
 import tagger
 from mockdata import item, order, refund, transaction
+from partition import DEFAULT_MAX_STATES_PER_PARTITION
 
 
 class Args:
@@ -19,7 +26,14 @@ def get_args(
         no_tag_categories=False,
         prompt_retag=False,
         num_updates=0,
-        retag_changed=False):
+        retag_changed=False,
+        max_partition_states_per_order=DEFAULT_MAX_STATES_PER_PARTITION,
+        max_partition_states=None,
+        association_workers=1,
+        match_consolidated_charges=False,
+        consolidated_max_orders=4,
+        consolidated_window_days=3,
+        matching_engine='python'):
     return Args(
         description_prefix=description_prefix,
         description_return_prefix=description_return_prefix,
@@ -30,6 +44,13 @@ def get_args(
         prompt_retag=prompt_retag,
         num_updates=num_updates,
         retag_changed=retag_changed,
+        max_partition_states_per_order=max_partition_states_per_order,
+        max_partition_states=max_partition_states,
+        association_workers=association_workers,
+        match_consolidated_charges=match_consolidated_charges,
+        consolidated_max_orders=consolidated_max_orders,
+        consolidated_window_days=consolidated_window_days,
+        matching_engine=matching_engine,
     )
 
 
@@ -63,6 +84,64 @@ class Tagger(unittest.TestCase):
         self.assertFalse(new_trans[0].is_child)
 
         self.assertEqual(stats['new_tag'], 1)
+        self.assertEqual(stats['amount_index_lookups'], 1)
+        self.assertEqual(stats['amount_index_hits'], 1)
+        self.assertEqual(stats['amount_index_near_hits'], 0)
+
+    def test_get_mint_updates_nearly_equal_amount(self):
+        i1 = item()
+        o1 = order()
+        t1 = transaction()
+        # Off by a fraction of a cent, e.g. from rounding tax.
+        t1.amount += 30
+
+        stats = Counter()
+        updates = tagger.get_mint_updates(
+            [o1], [i1], [],
+            [t1],
+            get_args(), stats)
+
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(stats['amount_index_hits'], 1)
+        self.assertEqual(stats['amount_index_near_hits'], 1)
+
+    @unittest.skipIf(matching.np is None, 'NumPy is not installed')
+    def test_get_mint_updates_numpy_engine(self):
+        o1 = order()
+        o2 = order(order_id='456', total_charged='$5.00')
+        r1 = refund(
+            refund_amount='$10.95',
+            refund_tax_amount='$1.00',
+            refund_date='3/12/14')
+        t1 = transaction()
+        t2 = transaction(amount='$11.95', is_debit=False, date='3/12/14')
+
+        updates = tagger.get_mint_updates(
+            [o1, o2], [item(), item(order_id='456')], [r1],
+            [t1, t2],
+            get_args(matching_engine='numpy'), Counter())
+
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(o1.matched)
+        self.assertFalse(o2.matched)
+        self.assertTrue(r1.matched)
+
+    def test_get_mint_updates_optimal_engine(self):
+        o1 = order(shipment_date='02/25/14')
+        o2 = order(order_id='456', shipment_date='02/28/14')
+        t1 = transaction(date='2/28/14')
+        t2 = transaction(date='3/2/14')
+
+        stats = Counter()
+        updates = tagger.get_mint_updates(
+            [o1, o2], [item(), item(order_id='456')], [],
+            [t1, t2],
+            get_args(matching_engine='optimal'), stats)
+
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(t1.orders, [o1])
+        self.assertEqual(t2.orders, [o2])
+        self.assertEqual(stats['amount_index_hits'], 2)
 
     def test_get_mint_updates_simple_match_refund(self):
         r1 = refund(
@@ -90,6 +169,24 @@ class Tagger(unittest.TestCase):
 
         self.assertEqual(stats['new_tag'], 1)
 
+    def test_get_mint_updates_consolidated_charge(self):
+        # Two orders with different order ids charged as one.
+        def get_updates(args):
+            return tagger.get_mint_updates(
+                [order(), order(order_id='456')],
+                [item(), item(order_id='456')],
+                [],
+                [transaction(amount='$23.90')],
+                args, Counter())
+
+        self.assertEqual(len(get_updates(get_args())), 0)
+
+        updates = get_updates(get_args(match_consolidated_charges=True))
+        self.assertEqual(len(updates), 1)
+        orig_t, new_trans = updates[0]
+        self.assertEqual(orig_t.amount, 23900000)
+        self.assertEqual(sum(t.amount for t in new_trans), 23900000)
+
     def test_get_mint_updates_skip_already_tagged(self):
         i1 = item()
         o1 = order()
@@ -133,6 +230,36 @@ class Tagger(unittest.TestCase):
         self.assertEqual(len(updates), 0)
         self.assertEqual(stats['already_up_to_date'], 1)
 
+    def test_get_mint_updates_update_memo(self):
+        update_memo = cache.LruMemo()
+
+        def get_updates(merchant='Amazon.com: 2x Duracell AAs'):
+            # Each run parses its own records.
+            stats = Counter()
+            updates = tagger.get_mint_updates(
+                [order()], [item()], [],
+                [transaction(merchant=merchant, category='Shopping')],
+                get_args(retag_changed=True), stats, update_memo=update_memo)
+            return updates, stats
+
+        updates, stats = get_updates()
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(stats['already_up_to_date'], 1)
+        self.assertEqual(update_memo.misses, 1)
+        self.assertEqual(len(update_memo), 1)
+
+        updates, stats = get_updates()
+        self.assertEqual(len(updates), 0)
+        self.assertEqual(stats['already_up_to_date'], 1)
+        self.assertEqual(update_memo.hits, 1)
+
+        # A change to the Mint transaction is a miss, and needing an update
+        # isn't remembered.
+        updates, stats = get_updates(merchant='Amazon.com: AAs')
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(update_memo.hits, 1)
+        self.assertEqual(len(update_memo), 1)
+
     def test_get_mint_updates_no_tag_categories_arg(self):
         i1 = item()
         o1 = order()
@@ -252,5 +379,36 @@ class Tagger(unittest.TestCase):
         self.assertEqual(len(updates2), 1)
 
 
+class MintStore(unittest.TestCase):
+    def test_get_trans_and_categories_from_store_never_synced(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mint_store = store.MintStore(os.path.join(tmp_dir, 'mint.sqlite'))
+            with self.assertRaises(SystemExit):
+                tagger.get_trans_and_categories_from_store(mint_store, None)
+            mint_store.close()
+
+
+class DefineArgs(unittest.TestCase):
+    def test_amazon_reports_missing_file(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            tagger.amazon_reports('/does/not/exist.csv')
+        with self.assertRaises(argparse.ArgumentTypeError):
+            tagger.amazon_reports('/does/not/exist*.csv')
+
+    def test_amazon_reports_globs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ['Items 2017.csv', 'Items 2018.csv', 'Other.csv']:
+                with open(os.path.join(tmp_dir, name), 'w') as f:
+                    f.write(name)
+
+            reports = tagger.amazon_reports(
+                '{0}/Items*.csv,{0}/Other.csv'.format(tmp_dir))
+            self.assertEqual(
+                [r.read() for r in reports],
+                ['Items 2017.csv', 'Items 2018.csv', 'Other.csv'])
+            for r in reports:
+                r.close()
+
+
 if __name__ == '__main__':
     unittest.main()